@@ -1,10 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
-from app.database import get_db
-from app import models, schemas
-from app.security import get_current_user, get_current_admin
+from app.database import get_db, pool_stats
+from app import models, schemas, search, playurl, crud
+from app.live_counters import live_counters
+from app.comment_cache import comment_cache
+from app.task.sync_scheduler import sync_scheduler
+from app.security import get_current_user, get_current_admin, invalidate_user
 import datetime  # 🔥 添加这行导入
+import json
+import asyncio
 from passlib.context import CryptContext
 from sqlalchemy.exc import IntegrityError
 import bcrypt  # 🔥 添加 bcrypt 直接导入
@@ -91,6 +96,7 @@ async def update_user_role(
     
     user.role = role_data["role"]
     db.commit()
+    invalidate_user(user.id)
     
     return {
         "code": 200,
@@ -112,6 +118,7 @@ async def update_user_status(
     
     user.is_active = status_data.get("is_active", True)
     db.commit()
+    invalidate_user(user.id)
     
     return {
         "code": 200,
@@ -142,9 +149,9 @@ async def get_videos(
     # 🆕 使用测试路由验证过的逻辑
     query = db.query(models.MovDetail)
     
-    # 视频名称搜索
+    # 视频名称搜索 - 走倒排索引
     if vod_name and vod_name.strip():
-        query = query.filter(models.MovDetail.vod_name.like(f"%{vod_name.strip()}%"))
+        query = query.filter(search.match_condition(vod_name.strip()))
         print(f"✅ 应用视频搜索: '{vod_name}'")
     
     # 分类搜索
@@ -218,9 +225,11 @@ async def delete_video_admin(
             for comment in comments:
                 db.delete(comment)
         
-        # 删除视频
+        # 删除视频及其搜索索引
+        search.remove_movdetail(db, video.id)
         db.delete(video)
         db.commit()
+        await comment_cache.invalidate(video_id)
         
         print(f"✅ 视频删除成功: {video_id}")
         
@@ -314,8 +323,10 @@ async def delete_comment_admin(
         for reply in comment.replies:
             db.delete(reply)
     
+    vod_id = comment.movdetail_id
     db.delete(comment)
     db.commit()
+    await comment_cache.invalidate(vod_id)
     
     return {
         "code": 200,
@@ -369,6 +380,43 @@ async def get_stats(
             "today_comments": today_comments
         }
     }
+
+@router.get("/db-pool", response_model=schemas.BaseResponse)
+async def get_db_pool_stats(current_user: models.User = Depends(get_current_admin)):
+    """数据库连接池统计: 占用/空闲连接数、等待耗时分布和超时次数 (仅当前 worker 进程)"""
+    return {
+        "code": 200,
+        "message": "获取连接池统计成功",
+        "data": pool_stats()
+    }
+
+@router.get("/sync/runs", response_model=schemas.BaseResponse)
+async def get_sync_runs(
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_admin)
+):
+    """片库增量同步: 调度状态、本进程累计统计和最近的运行记录"""
+    return {
+        "code": 200,
+        "message": "获取同步记录成功",
+        "data": {
+            "scheduler": sync_scheduler.stats(),
+            "runs": sync_scheduler.recent_runs(db, limit)
+        }
+    }
+
+@router.post("/sync/run", response_model=schemas.BaseResponse)
+async def trigger_sync(current_user: models.User = Depends(get_current_admin)):
+    """立即执行一次片库增量同步 (后台运行, 结果通过 /admin/sync/runs 查看)"""
+    # 检查的是全局同步锁, 其他 worker 或 sync_daemon 正在同步时同样拒绝
+    if await sync_scheduler.is_busy() or not sync_scheduler.trigger():
+        raise HTTPException(status_code=409, detail="片库同步正在进行中")
+    return {
+        "code": 200,
+        "message": "片库同步已开始",
+        "data": None
+    }
     
 @router.get("/debug-search")
 async def debug_search(
@@ -386,12 +434,12 @@ async def debug_search(
     direct_count = result.scalar()
     print(f"直接SQL查询结果: {direct_count} 条")
     
-    # 测试2：ORM查询
+    # 测试2：倒排索引查询
     orm_query = db.query(models.MovDetail)
     if vod_name:
-        orm_query = orm_query.filter(models.MovDetail.vod_name.like(f"%{vod_name}%"))
-    orm_count = orm_query.count()
-    print(f"ORM查询结果: {orm_count} 条")
+        orm_query = orm_query.filter(search.match_condition(vod_name))
+    orm_count = search.count_matches(db, vod_name) if vod_name else orm_query.count()
+    print(f"索引查询结果: {orm_count} 条")
     
     # 测试3：获取几条数据看看
     sample_data = orm_query.limit(3).all()
@@ -445,16 +493,18 @@ async def get_live_streams_admin(
     
     # 获取总数和分页数据
     total = query.count()
-    streams = query.order_by(models.LiveStream.created_time.desc()).offset(skip).limit(page_size).all()
+    streams = query.options(
+        joinedload(models.LiveStream.user)
+    ).order_by(models.LiveStream.created_time.desc()).offset(skip).limit(page_size).all()
     
     print(f"📊 直播流搜索结果: {len(streams)} 条，总计 {total} 条")
     
+    # 一次查询取回本页所有直播的评论数
+    comment_counts = crud.get_live_comment_counts(db, [stream.id for stream in streams])
+    
     stream_list = []
     for stream in streams:
-        # 获取评论数量
-        comment_count = db.query(models.LiveComment).filter(
-            models.LiveComment.live_stream_id == stream.id
-        ).count()
+        comment_count = comment_counts.get(stream.id, 0)
         
         streamer_name = stream.user.name if stream.user else "未知主播"
         
@@ -474,8 +524,8 @@ async def get_live_streams_admin(
             "streamer_id": stream.user_id,
             "status": stream.status,
             "status_text": "直播中" if stream.status == 1 else "已结束",
-            "viewer_count": stream.viewer_count or 0,
-            "max_viewers": stream.max_viewers or 0,
+            "viewer_count": live_counters.viewer_count(stream),
+            "max_viewers": live_counters.max_viewers(stream),
             "comment_count": comment_count,
             "stream_key": stream.stream_key,
             "created_time": convert_time(stream.created_time),  # 🔥 使用转换后的时间
@@ -812,9 +862,11 @@ async def create_video(
         
         insert_sql = text("""
             INSERT INTO sakura_movdetail 
-            (vod_id, vod_name, vod_pic, vod_remarks, type_id, type_name, vod_content, vod_play_url, vod_time) 
+            (vod_id, vod_name, vod_pic, vod_remarks, type_id, type_name, vod_content, vod_play_url, vod_time,
+             vod_play_list, vod_content_clean) 
             VALUES 
-            (:vod_id, :vod_name, :vod_pic, :vod_remarks, :type_id, :type_name, :vod_content, :vod_play_url, :vod_time)
+            (:vod_id, :vod_name, :vod_pic, :vod_remarks, :type_id, :type_name, :vod_content, :vod_play_url, :vod_time,
+             :vod_play_list, :vod_content_clean)
         """)
         
         params = {
@@ -828,8 +880,12 @@ async def create_video(
             'vod_play_url': video_data.get("vod_play_url", ""),
             'vod_time': datetime.datetime.utcnow()
         }
+        # 入库时预处理播放列表和简介
+        playurl.prepare_movdetail(params)
+        params['vod_play_list'] = json.dumps(params['vod_play_list'], ensure_ascii=False)
         
         db.execute(insert_sql, params)
+        search.index_vod_ids(db, [next_vod_id])
         db.commit()
         
         print(f"✅ 视频创建成功: {video_data['vod_name']} (ID: {next_vod_id})")
@@ -905,6 +961,7 @@ async def create_comment(
         db.add(new_comment)
         db.commit()
         db.refresh(new_comment)
+        await comment_cache.invalidate(new_comment.movdetail_id)
         
         print(f"✅ 评论创建成功: {new_comment.id}")
         
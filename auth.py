@@ -6,6 +6,7 @@ from sqlalchemy.orm import Session
 from app import models
 from app import crud, schemas, security
 from app.database import get_db  # 使用统一的 get_db
+from app.password_hasher import password_hasher, HashQueueFull
 
 router = APIRouter(
     prefix="/auth",
@@ -67,9 +68,10 @@ async def register(request: Request, db: Session = Depends(get_db)):
         if len(safe_password) > 50:
             safe_password = safe_password[:50]
             
+        # 哈希计算在独立线程池中执行, 不阻塞事件循环
         new_user = models.User(
             name=username,
-            password_hash=security.get_password_hash(safe_password)
+            password_hash=await password_hasher.hash(safe_password)
         )
         db.add(new_user)
         db.commit()
@@ -81,6 +83,12 @@ async def register(request: Request, db: Session = Depends(get_db)):
             "data": None
         }
             
+    except HashQueueFull:
+        return {
+            "code": 503,
+            "message": "注册人数过多，请稍后重试",
+            "data": None
+        }
     except Exception as e:
         db.rollback()
         print(f"💥 注册异常: {e}")
@@ -159,11 +167,21 @@ async def login(request: Request, db: Session = Depends(get_db)):
         
         # 验证密码
         print("� 开始密码验证...")
-        from app.security import verify_password
-        is_valid = verify_password(password, user.password_hash)
+        is_valid = await password_hasher.verify(password, user.password_hash)
         print(f"� 密码验证最终结果: {is_valid}")
         
         if is_valid:
+            # 旧格式或强度不符的哈希, 借登录时的明文重新生成
+            if security.password_needs_rehash(user.password_hash):
+                try:
+                    user.password_hash = await password_hasher.hash(password)
+                    db.commit()
+                    password_hasher.counters['rehashed'] += 1
+                    print(f"🔐 已升级用户 {user.name} 的密码哈希")
+                except Exception as e:
+                    db.rollback()
+                    print(f"⚠️ 密码哈希升级失败: {e}")
+            
             from app.security import generate_auth_token
             token = generate_auth_token(user_id=user.id, name=user.name)
             
@@ -187,6 +205,13 @@ async def login(request: Request, db: Session = Depends(get_db)):
                 "data": None
             }
             
+    except HashQueueFull:
+        print("⚠️ 密码校验排队过多, 拒绝登录请求")
+        return {
+            "code": 503,
+            "message": "登录人数过多，请稍后重试",
+            "data": None
+        }
     except Exception as e:
         print(f"💥 登录异常: {e}")
         import traceback
@@ -196,6 +221,17 @@ async def login(request: Request, db: Session = Depends(get_db)):
             "message": f"登录失败: {str(e)}",
             "data": None
         }
+@router.get("/hash_stats", response_model=schemas.BaseResponse)
+def get_hash_stats(current_user: models.User = Depends(security.get_current_admin)):
+    """
+    密码哈希线程池的排队与耗时统计 (管理员)
+    """
+    return {
+        "code": 200,
+        "message": "success",
+        "data": password_hasher.stats()
+    }
+
 @router.get("/user", response_model=schemas.BaseResponse)
 def get_user(current_user: models.User = Depends(security.get_current_user)):
     """
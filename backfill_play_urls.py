@@ -0,0 +1,63 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import inspect, text
+from app.database import engine, SessionLocal
+from app import models, playurl
+
+
+def add_missing_columns():
+    """为老的 sakura_movdetail 表补充预处理字段"""
+    columns = {column['name'] for column in inspect(engine).get_columns('sakura_movdetail')}
+    with engine.begin() as conn:
+        if 'vod_play_list' not in columns:
+            print("🔧 添加字段 vod_play_list")
+            conn.execute(text("ALTER TABLE sakura_movdetail ADD COLUMN vod_play_list JSON NULL"))
+        if 'vod_content_clean' not in columns:
+            print("🔧 添加字段 vod_content_clean")
+            conn.execute(text("ALTER TABLE sakura_movdetail ADD COLUMN vod_content_clean TEXT NULL"))
+
+
+def backfill_play_urls(batch_size=500):
+    """
+    回填已有数据的剧集列表和简介
+    batch_size: 每批处理的影片数
+    """
+    add_missing_columns()
+
+    db = SessionLocal()
+    try:
+        total = 0
+        last_id = 0
+        while True:
+            movs = db.query(
+                models.MovDetail.id, models.MovDetail.vod_play_url, models.MovDetail.vod_content
+            ).filter(
+                models.MovDetail.id > last_id,
+                models.MovDetail.vod_play_list.is_(None)
+            ).order_by(models.MovDetail.id).limit(batch_size).all()
+            if not movs:
+                break
+
+            db.bulk_update_mappings(models.MovDetail, [
+                {
+                    'id': mov_id,
+                    'vod_play_list': playurl.parse_play_url(vod_play_url),
+                    'vod_content_clean': playurl.sanitize_content(vod_content),
+                }
+                for mov_id, vod_play_url, vod_content in movs
+            ])
+            db.commit()
+
+            total += len(movs)
+            last_id = movs[-1][0]
+            print(f"✅ 已回填 {total} 部影片")
+
+        print(f"🎉 回填完成, 共处理 {total} 部影片")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    backfill_play_urls()
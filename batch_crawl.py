@@ -2,36 +2,48 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+import logging
+
 from app.database import engine
 from app import models
-from app.task.sakura_crawler import SakuraData
+from app.task.catalog_crawler import crawl
+
+def print_result(result):
+    print(f"   页数 {result['total_pages']}, 跳过 {result['pages_skipped']}, 写入 {result['pages_written']}, "
+          f"失败 {result['pages_failed']}, 影片 {result['items']} 条 (新增 {result['inserted']}, 更新 {result['updated']}, "
+          f"未变 {result['unchanged']}), 重试 {result['retries']} 次, 耗时 {result['seconds']}s")
+    if result['failed_pages']:
+        print(f"⚠️ 失败的页: {result['failed_pages']} (重新运行会从断点继续)")
 
-def batch_crawl_movies(batch_size=10):
+def batch_crawl_movies(batch_size=None, resume=True):
     """
-    分批爬取电影数据
-    batch_size: 每次爬取的页数
+    并发爬取电影数据 (并发数 / 限速通过 CRAWL_* 环境变量配置)
+    batch_size: 只爬取前 N 页, None 表示全部
+    resume: 跳过上次中断前已完成的页
     """
     # 创建数据库表
     models.Base.metadata.create_all(bind=engine)
     
-    sk = SakuraData()
-    
-    print(f"🚀 开始分批爬取，每批 {batch_size} 页...")
+    scope = f"前 {batch_size} 页" if batch_size else "全部分页"
+    print(f"🚀 开始并发爬取{scope}...")
     
     # 先爬取基本信息
     print("📋 爬取电影基本信息...")
-    for page in range(1, batch_size + 1):
-        sk.get_mov_info(page)
-        print(f"✅ MovInfo 第 {page} 页完成")
+    print_result(crawl('mov_info', max_pages=batch_size, resume=resume))
     
     # 爬取详细信息
     print("🎬 爬取电影详细信息...")
-    for page in range(1, batch_size + 1):
-        sk.get_mov_detail(page)
-        print(f"✅ MovDetail 第 {page} 页完成")
+    print_result(crawl('mov_detail', max_pages=batch_size, resume=resume))
     
-    print(f"🎉 第一批 {batch_size} 页数据爬取完成！")
+    print(f"🎉 {scope}数据爬取完成！")
     print("现在前端应该能看到电影数据了！")
 
 if __name__ == '__main__':
-    batch_crawl_movies(5)  # 先爬5页测试
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO)
+    # python batch_crawl.py          先爬5页测试
+    # python batch_crawl.py all      全量爬取 (可中断续爬)
+    # python batch_crawl.py all --restart   忽略断点从头爬取
+    if len(sys.argv) > 1 and sys.argv[1] == 'all':
+        batch_crawl_movies(None, resume='--restart' not in sys.argv)
+    else:
+        batch_crawl_movies(5)
\ No newline at end of file
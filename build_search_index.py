@@ -0,0 +1,26 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import engine, SessionLocal
+from app import models, search
+
+
+def build_search_index(batch_size=500):
+    """
+    全量重建片库搜索倒排索引
+    batch_size: 每批处理的影片数
+    """
+    models.Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        print("🔎 开始重建搜索索引...")
+        total = search.rebuild_index(db, batch_size=batch_size)
+        print(f"🎉 搜索索引重建完成, 共索引 {total} 部影片")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    build_search_index()
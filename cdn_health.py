@@ -0,0 +1,197 @@
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Dict, List, Optional
+
+from app import hls_proxy
+
+# CDN 健康探测
+# 后台定时探测镜像组内的 CDN 主机 (以播放地址中见到的路径为样本), 记录延迟和错误率;
+# 不属于任何镜像组的主机不会被切换, 也不记录、不探测;
+# 详情接口和代理在内存表中为每个地址挑选最快的健康镜像, 请求路径上不做任何探测
+
+# 镜像组: 同一组内的主机提供相同路径的内容, 未探测前按组内顺序优先
+DEFAULT_MIRROR_GROUPS = [
+    ["vod12.wgslsw.com", "v8.qewbn.com", "ts1.yhzybf.com"],
+]
+MIRROR_GROUPS = json.loads(os.getenv("CDN_MIRROR_GROUPS", "null")) or DEFAULT_MIRROR_GROUPS
+
+PROBE_INTERVAL = float(os.getenv("CDN_PROBE_INTERVAL", "60"))
+PROBE_TIMEOUT = float(os.getenv("CDN_PROBE_TIMEOUT", "5"))
+EWMA_ALPHA = 0.3
+UNHEALTHY_ERROR_RATE = 0.5
+# 当前主机与最快主机延迟相差不足该比例时不切换, 避免来回抖动
+SWITCH_MARGIN = 0.2
+
+
+def _split_host(url: str):
+    """拆分为 (scheme://, host, 剩余路径), 非 http 地址返回 None"""
+    scheme, sep, rest = url.partition('://')
+    if not sep or scheme not in ('http', 'https'):
+        return None
+    host, slash, path = rest.partition('/')
+    return scheme + sep, host, slash + path
+
+
+class HostStats:
+    def __init__(self):
+        self.latency_ms: Optional[float] = None
+        self.error_rate = 0.0
+        self.probes = 0
+        self.failures = 0
+        self.last_probe_at: Optional[float] = None
+
+    @property
+    def healthy(self) -> bool:
+        return self.error_rate < UNHEALTHY_ERROR_RATE
+
+    def record(self, ok: bool, latency_ms: Optional[float]) -> None:
+        self.probes += 1
+        self.last_probe_at = time.time()
+        if not ok:
+            self.failures += 1
+        self.error_rate = EWMA_ALPHA * (0.0 if ok else 1.0) + (1 - EWMA_ALPHA) * self.error_rate
+        if ok and latency_ms is not None:
+            if self.latency_ms is None:
+                self.latency_ms = latency_ms
+            else:
+                self.latency_ms = EWMA_ALPHA * latency_ms + (1 - EWMA_ALPHA) * self.latency_ms
+
+    def to_dict(self) -> dict:
+        return {
+            'healthy': self.healthy,
+            'latency_ms': round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            'error_rate': round(self.error_rate, 3),
+            'probes': self.probes,
+            'failures': self.failures,
+            'last_probe_at': self.last_probe_at,
+        }
+
+
+class CdnHealth:
+    def __init__(self, mirror_groups: List[List[str]], interval: float, timeout: float):
+        self.interval = interval
+        self.timeout = timeout
+        self._groups = [list(group) for group in mirror_groups]
+        self._group_of: Dict[str, List[str]] = {}
+        for group in self._groups:
+            for host in group:
+                self._group_of[host] = group
+        self._stats: Dict[str, HostStats] = {}
+        # 每个镜像组 (或独立主机) 最近见到的 (scheme, 路径), 作为探测样本
+        self._samples: Dict[str, tuple] = {}
+        self._best: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _sample_key(self, host: str) -> str:
+        group = self._group_of.get(host)
+        return group[0] if group else host
+
+    def pick(self, url: str) -> str:
+        """
+        为地址挑选最快的健康镜像 (纯内存查表)
+        镜像组内的主机同时记录见到的路径作为探测样本, 组外主机原样返回;
+        任意地址都可能经代理传入, 只登记配置过的主机, 探测表不随请求增长
+        """
+        parts = _split_host(url)
+        if parts is None:
+            return url
+        scheme, host, path = parts
+        group = self._group_of.get(host)
+        if group is None:
+            return url
+        if host not in self._stats:
+            self._stats[host] = HostStats()
+        self._samples[group[0]] = (scheme, path)
+        best = self._best.get(group[0], group[0])
+        if best == host:
+            return url
+        return scheme + best + path
+
+    def _choose(self, group: List[str]) -> str:
+        """按健康状况和延迟选出组内最佳主机, 未探测的主机按组内顺序排在已测主机之后"""
+        current = self._best.get(group[0], group[0])
+        candidates = []
+        for index, host in enumerate(group):
+            stats = self._stats.get(host)
+            if stats is not None and not stats.healthy:
+                continue
+            latency = stats.latency_ms if stats is not None and stats.latency_ms is not None else float('inf')
+            candidates.append((latency, index, host))
+        if not candidates:
+            return current
+        latency, _, best = min(candidates)
+        current_stats = self._stats.get(current)
+        if (current != best and current_stats is not None and current_stats.healthy
+                and current_stats.latency_ms is not None
+                and current_stats.latency_ms <= latency * (1 + SWITCH_MARGIN)):
+            return current
+        return best
+
+    async def _probe(self, host: str, url: str) -> None:
+        client = hls_proxy.get_client()
+        stats = self._stats.setdefault(host, HostStats())
+        started = time.perf_counter()
+        try:
+            response = await client.get(url, headers={'Range': 'bytes=0-1023'}, timeout=self.timeout)
+            ok = response.status_code < 400
+        except Exception:
+            ok = False
+        stats.record(ok, (time.perf_counter() - started) * 1000)
+
+    async def probe_once(self) -> None:
+        """探测一轮所有已知主机"""
+        probes = []
+        for host in list(self._stats):
+            sample = self._samples.get(self._sample_key(host))
+            if sample is None:
+                continue
+            scheme, path = sample
+            probes.append(self._probe(host, scheme + host + path))
+        for group in self._groups:
+            sample = self._samples.get(group[0])
+            if sample is None:
+                continue
+            scheme, path = sample
+            for host in group:
+                if host not in self._stats:
+                    self._stats[host] = HostStats()
+                    probes.append(self._probe(host, scheme + host + path))
+        if probes:
+            await asyncio.gather(*probes)
+        for group in self._groups:
+            self._best[group[0]] = self._choose(group)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.probe_once()
+            except Exception as e:
+                print(f"⚠️ CDN 探测失败: {e}")
+            # 加入随机抖动, 避免多个 worker 同时探测
+            await asyncio.sleep(self.interval * random.uniform(0.8, 1.2))
+
+    def start(self) -> None:
+        """启动后台探测任务, 在应用启动时调用"""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            'hosts': {host: stats.to_dict() for host, stats in self._stats.items()},
+            'preferred': {group[0]: self._best.get(group[0], group[0]) for group in self._groups},
+        }
+
+
+cdn_health = CdnHealth(MIRROR_GROUPS, PROBE_INTERVAL, PROBE_TIMEOUT)
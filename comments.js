@@ -11,9 +11,19 @@ export function postComments(vod_id, data) {
 	})
 }
 
-// 显示评论列表
-export function showComments(vod_id) {
+// 显示评论列表 (params: page / pageSize, 按主评论分页)
+export function showComments(vod_id, params) {
     var url = '/comments/show/' + vod_id  // 🔥 修正路径
+	return service({
+		url: url,
+		method: 'get',
+		params: params,
+	})
+}
+
+// 获取某条评论下的全部回复
+export function showReplies(comment_id) {
+    var url = '/comments/replies/' + comment_id
 	return service({
 		url: url,
 		method: 'get',
@@ -1,71 +1,166 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from app.database import get_db
+from typing import Dict, List, Optional, Tuple
+from collections import defaultdict
+from datetime import timedelta
+from app.database import get_db, get_async_db
 from app import models, schemas
+from app.comment_cache import comment_cache
 from app.security import get_current_user 
 import datetime  # 🔥 确保导入 datetime
 
 router = APIRouter(prefix="/comments", tags=["comments"])  # 🔥 添加正确的 prefix
 
+# 每条主评论内联返回的回复数上限, 完整回复通过 /comments/replies/{comment_id} 获取
+REPLY_INLINE_LIMIT = 20
+
+
+def format_comment_time(timestamp) -> str:
+    """🔥 UTC转北京时间"""
+    if not timestamp:
+        return "未知时间"
+    return (timestamp + timedelta(hours=8)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _comment_rows_statement(vod_id: int):
+    return select(
+        models.Comment.id,
+        models.Comment.body,
+        models.Comment.timestamp,
+        models.Comment.user_id,
+        models.Comment.replied_id,
+        models.User.name.label('user_name')
+    ).outerjoin(
+        models.User, models.User.id == models.Comment.user_id
+    ).where(
+        models.Comment.movdetail_id == vod_id
+    )
+
+
+def load_comment_rows(db: Session, vod_id: int) -> list:
+    """一次查询取出影片的全部评论 (含回复) 及评论人名称"""
+    return db.execute(_comment_rows_statement(vod_id)).all()
+
+
+async def load_comment_rows_async(db: AsyncSession, vod_id: int) -> list:
+    """load_comment_rows 的异步版本"""
+    return (await db.execute(_comment_rows_statement(vod_id))).all()
+
+
+class CommentTree:
+    """在内存中把评论行组装成树, O(n)"""
+
+    def __init__(self, rows: list):
+        self.by_id = {row.id: row for row in rows}
+        self.children: Dict[int, list] = defaultdict(list)
+        self.roots = []
+        for row in rows:
+            # 父评论不存在 (已删除) 的回复按主评论展示
+            if row.replied_id is not None and row.replied_id in self.by_id:
+                self.children[row.replied_id].append(row)
+            else:
+                self.roots.append(row)
+        # 主评论按时间倒序, 回复按发表顺序
+        self.roots.sort(key=lambda row: (row.timestamp is not None, row.timestamp, row.id), reverse=True)
+        for replies in self.children.values():
+            replies.sort(key=lambda row: row.id)
+
+    def _reply(self, row) -> dict:
+        parent = self.by_id.get(row.replied_id)
+        return {
+            "user_name": row.user_name or '匿名用户',
+            "id": row.id,
+            "reply_user_name": (parent.user_name or '匿名用户') if parent else None,
+            "body": row.body,
+            "time": format_comment_time(row.timestamp),
+            "user_id": row.user_id,
+        }
+
+    def replies(self, root_id: int, limit: Optional[int] = None) -> Tuple[List[dict], int]:
+        """按深度优先顺序展开某条评论下的所有回复, 返回 (前 limit 条, 回复总数)"""
+        result = []
+        total = 0
+        stack = list(reversed(self.children.get(root_id, [])))
+        while stack:
+            row = stack.pop()
+            total += 1
+            if limit is None or len(result) < limit:
+                result.append(self._reply(row))
+            stack.extend(reversed(self.children.get(row.id, [])))
+        return result, total
+
+    def thread(self, row, reply_limit: Optional[int]) -> dict:
+        reply_list, reply_count = self.replies(row.id, reply_limit)
+        return {
+            "user_name": row.user_name or '匿名用户',
+            "body": row.body,
+            "time": format_comment_time(row.timestamp),
+            "id": row.id,
+            "user_id": row.user_id,
+            "reply_list": reply_list,
+            "reply_count": reply_count,
+        }
+
+
 @router.get("/show/{vod_id}", response_model=schemas.CommentListResponse)
-async def show_comments(vod_id: int, db: Session = Depends(get_db)):
+async def show_comments(
+    vod_id: int,
+    request: Request,
+    response: Response,
+    page: int = Query(1, ge=1),
+    pageSize: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
-    展示评论信息
+    展示评论信息 - 按主评论分页, 每条主评论内联前 REPLY_INLINE_LIMIT 条回复
+    整个影片的评论树按 vod_id 缓存, 评论未变化时返回 304
     """
-    def get_all_replies(reply_comments, result: List):
-        for comment in reply_comments:
-            # 🔥 方案A插入点1：修复回复时间显示
-            time_str = "未知时间"
-            if comment.timestamp:
-                from datetime import timedelta
-                beijing_time = comment.timestamp + timedelta(hours=8)  # 🔥 UTC转北京时间
-                time_str = beijing_time.strftime('%Y-%m-%d %H:%M:%S')
-            
-            reply = {
-                "user_name": comment.user.name,
-                "id": comment.id,
-                "reply_user_name": comment.replied.user.name if comment.replied else None,
-                "body": comment.body,
-                "time": time_str,  # 🔥 使用转换后的时间
-                "user_id": comment.user_id,
-            }
-            result.append(reply)
-            if comment.replies:
-                get_all_replies(comment.replies, result)
-
-    comments = db.query(models.Comment).filter(
-        models.Comment.movdetail_id == vod_id
-    ).order_by(models.Comment.timestamp.desc()).all()
+    entry = await comment_cache.get(vod_id)
+    if entry is None:
+        generation = await comment_cache.generation(vod_id)
+        tree = CommentTree(await load_comment_rows_async(db, vod_id))
+        threads = [tree.thread(row, REPLY_INLINE_LIMIT) for row in tree.roots]
+        entry = await comment_cache.put(vod_id, threads, generation)
     
-    comment_list = []
-    for comment in comments:
-        # 🔥 方案A插入点2：修复主评论时间显示
-        time_str = "未知时间"
-        if comment.timestamp:
-            from datetime import timedelta
-            beijing_time = comment.timestamp + timedelta(hours=8)  # 🔥 UTC转北京时间
-            time_str = beijing_time.strftime('%Y-%m-%d %H:%M:%S')
-            print(f"    ✅ UTC时间: {comment.timestamp}, 北京时间: {beijing_time}")
-        
-        c = {
-            "user_name": comment.user.name,
-            "body": comment.body,
-            "time": time_str,  # 🔥 使用转换后的时间
-            "id": comment.id,
-            "user_id": comment.user_id,
-        }
-        reply_list = []
-        if comment.replies:
-            get_all_replies(comment.replies, reply_list)
-        c['reply_list'] = reply_list
-        comment_list.append(c)
+    etag = f'W/"{entry["etag"]}-{page}-{pageSize}"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
     
+    threads = entry['threads']
+    start = (page - 1) * pageSize
     return {
         "code": 200,
-        "data": comment_list,
+        "data": threads[start:start + pageSize],
+        "total": len(threads),
         "message": "评论获取成功"
     }
+
+@router.get("/replies/{comment_id}", response_model=schemas.CommentReplyListResponse)
+async def show_replies(comment_id: int, db: Session = Depends(get_db)):
+    """
+    获取某条评论下的全部回复
+    """
+    comment = db.query(models.Comment.movdetail_id).filter(
+        models.Comment.id == comment_id
+    ).first()
+    if not comment:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="此评论已不存在"
+        )
+    
+    tree = CommentTree(load_comment_rows(db, comment.movdetail_id))
+    reply_list, _ = tree.replies(comment_id)
+    
+    return {
+        "code": 200,
+        "data": reply_list,
+        "message": "回复获取成功"
+    }
     
 # 在 comments.py 中修改 post_comments 函数
 @router.post("/publish/{vod_id}")
@@ -95,6 +190,7 @@ async def post_comments(
         db.add(comment)
         db.commit()
         db.refresh(comment)
+        await comment_cache.invalidate(vod_id)
         
         print(f"✅ 新评论发表成功: 用户={current_user.name}, 时间={comment.timestamp}")
         
@@ -148,6 +244,7 @@ async def reply_comment(
         db.add(reply_comment)
         db.commit()
         db.refresh(reply_comment)
+        await comment_cache.invalidate(parent_comment.movdetail_id)
         
         print(f"✅ 回复发表成功: 用户={current_user.name}, 时间={reply_comment.timestamp}")
         
@@ -178,8 +275,10 @@ async def delete_comment(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="评论不存在或无权限删除"
         )
+    vod_id = comment.movdetail_id
     db.delete(comment)
     db.commit()
+    await comment_cache.invalidate(vod_id)
     return {
         "code": 200,
         "message": "评论删除成功"
@@ -201,8 +300,10 @@ async def delete_reply(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="回复不存在或无权限删除"
         )
+    vod_id = reply.movdetail_id
     db.delete(reply)
     db.commit()
+    await comment_cache.invalidate(vod_id)
     return {
         "code": 200,
         "message": "回复删除成功"
@@ -1,4 +1,7 @@
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from typing import Dict, Iterable
 from app import models, schemas
 from app.security import get_password_hash 
 
@@ -69,4 +72,30 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
-    return db_user
\ No newline at end of file
+    return db_user
+
+
+# === 直播相关的批量查询 ===
+
+def _live_comment_counts_statement(stream_ids: list):
+    return select(
+        models.LiveComment.live_stream_id, func.count(models.LiveComment.id)
+    ).where(
+        models.LiveComment.live_stream_id.in_(stream_ids)
+    ).group_by(models.LiveComment.live_stream_id)
+
+def get_live_comment_counts(db: Session, stream_ids: Iterable[int]) -> Dict[int, int]:
+    """批量获取直播评论数 - 一次 GROUP BY 查询代替逐条 COUNT"""
+    stream_ids = list(stream_ids)
+    if not stream_ids:
+        return {}
+    rows = db.execute(_live_comment_counts_statement(stream_ids)).all()
+    return {stream_id: count for stream_id, count in rows}
+
+async def get_live_comment_counts_async(db: AsyncSession, stream_ids: Iterable[int]) -> Dict[int, int]:
+    """get_live_comment_counts 的异步版本"""
+    stream_ids = list(stream_ids)
+    if not stream_ids:
+        return {}
+    result = await db.execute(_live_comment_counts_statement(stream_ids))
+    return {stream_id: count for stream_id, count in result.all()}
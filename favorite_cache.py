@@ -0,0 +1,68 @@
+import os
+import time
+from collections import OrderedDict
+from typing import FrozenSet
+
+from sqlalchemy.orm import Session
+
+from app import models
+
+# 用户收藏集合缓存
+# 按用户缓存收藏的影片 ID 集合, 卡片列表批量判断收藏状态时只做内存查找;
+# 本进程内的收藏 / 取消收藏直接更新集合, TTL 兜底其他 worker 的修改
+
+FAVORITE_CACHE_TTL = int(os.getenv("FAVORITE_CACHE_TTL", "60"))
+FAVORITE_CACHE_USERS = int(os.getenv("FAVORITE_CACHE_USERS", "10000"))
+# 批量查询单次最多的影片数
+MAX_BATCH_SIZE = 100
+
+
+class FavoriteSetCache:
+    def __init__(self, max_users: int, ttl: int):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self.counters = {'hits': 0, 'misses': 0}
+
+    def _store(self, user_id: int, vod_ids: FrozenSet[int]) -> None:
+        self._entries[user_id] = (time.time() + self.ttl, vod_ids)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+
+    def get(self, db: Session, user_id: int) -> FrozenSet[int]:
+        """返回用户收藏的影片 ID 集合, 未命中时从收藏表加载"""
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > time.time():
+            self._entries.move_to_end(user_id)
+            self.counters['hits'] += 1
+            return entry[1]
+        self.counters['misses'] += 1
+        vod_ids = frozenset(
+            vod_id for (vod_id,) in db.query(models.UserCollectionItem.movdetail_id).filter(
+                models.UserCollectionItem.user_id == user_id
+            ).all()
+        )
+        self._store(user_id, vod_ids)
+        return vod_ids
+
+    def added(self, user_id: int, vod_id: int) -> None:
+        """收藏提交后调用: 已缓存时直接更新集合"""
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            self._entries[user_id] = (entry[0], entry[1] | {vod_id})
+
+    def removed(self, user_id: int, vod_id: int) -> None:
+        """取消收藏提交后调用"""
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            self._entries[user_id] = (entry[0], entry[1] - {vod_id})
+
+    def invalidate(self, user_id: int) -> None:
+        self._entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return {**self.counters, 'users': len(self._entries)}
+
+
+favorite_cache = FavoriteSetCache(FAVORITE_CACHE_USERS, FAVORITE_CACHE_TTL)
@@ -0,0 +1,264 @@
+import asyncio
+import os
+import re
+from typing import Optional, Tuple
+
+import httpx
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+
+# HLS 代理引擎
+# 全局共享一个带连接池的异步 HTTP 客户端, 对同一上游主机复用 keep-alive 连接,
+# 分片按块流式转发, 不在内存中缓存整个 TS 文件
+
+UPSTREAM_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Referer': 'https://example.com/'
+}
+
+# 连接池与并发配置
+MAX_CONNECTIONS = int(os.getenv("HLS_PROXY_MAX_CONNECTIONS", "200"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HLS_PROXY_MAX_KEEPALIVE", "50"))
+MAX_CONCURRENT_UPSTREAM = int(os.getenv("HLS_PROXY_CONCURRENCY", "256"))
+QUEUE_TIMEOUT = float(os.getenv("HLS_PROXY_QUEUE_TIMEOUT", "10"))
+CONNECT_TIMEOUT = float(os.getenv("HLS_PROXY_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("HLS_PROXY_READ_TIMEOUT", "30"))
+CHUNK_SIZE = 64 * 1024
+
+# 需要透传给播放器的响应头
+PASSTHROUGH_HEADERS = ('content-length', 'content-range', 'accept-ranges', 'etag', 'last-modified')
+
+_client: Optional[httpx.AsyncClient] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class UpstreamBusy(Exception):
+    """等待上游并发名额超时"""
+
+
+class EntryTooLarge(Exception):
+    """上游文件超过可缓存的大小上限"""
+
+
+def get_client() -> httpx.AsyncClient:
+    """获取共享的异步 HTTP 客户端 (首次调用时创建)"""
+    global _client, _semaphore
+    if _client is None:
+        _client = httpx.AsyncClient(
+            headers=UPSTREAM_HEADERS,
+            follow_redirects=True,
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            ),
+        )
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENT_UPSTREAM)
+    return _client
+
+
+async def close_client() -> None:
+    """关闭客户端, 在应用关闭时调用"""
+    global _client, _semaphore
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _semaphore = None
+
+
+async def _acquire() -> None:
+    try:
+        await asyncio.wait_for(_semaphore.acquire(), timeout=QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise UpstreamBusy("上游并发已满")
+
+
+def guess_content_type(url: str) -> str:
+    """根据文件扩展名推断 Content-Type"""
+    path = url.split('?', 1)[0].lower()
+    if path.endswith('.ts'):
+        return "video/mp2t"
+    if path.endswith('.m3u8'):
+        return "application/vnd.apple.mpegurl"
+    if path.endswith('.jpeg') or path.endswith('.jpg'):
+        return "image/jpeg"
+    if path.endswith('.png'):
+        return "image/png"
+    return "application/octet-stream"
+
+
+async def fetch_text(url: str) -> str:
+    """获取文本内容 (播放列表)"""
+    client = get_client()
+    await _acquire()
+    try:
+        response = await client.get(url)
+        response.raise_for_status()
+        return response.text
+    finally:
+        _semaphore.release()
+
+
+async def fetch_playlist(url: str, etag: Optional[str] = None,
+                         last_modified: Optional[str] = None) -> Tuple[int, str, Optional[str], Optional[str]]:
+    """
+    获取播放列表, 支持条件请求
+    返回 (状态码, 文本, ETag, Last-Modified); 304 时文本为空
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    client = get_client()
+    await _acquire()
+    try:
+        response = await client.get(url, headers=headers)
+        if response.status_code == 304:
+            return 304, '', etag, last_modified
+        response.raise_for_status()
+        return (response.status_code, response.text,
+                response.headers.get('etag'), response.headers.get('last-modified'))
+    finally:
+        _semaphore.release()
+
+
+async def stream_file(url: str, range_header: Optional[str] = None) -> Response:
+    """流式转发上游文件, 支持 Range 请求"""
+    client = get_client()
+    # 不让上游压缩, 保证 Content-Length / Content-Range 与转发的字节一致
+    headers = {'Accept-Encoding': 'identity'}
+    if range_header:
+        headers['Range'] = range_header
+
+    await _acquire()
+    try:
+        request = client.build_request('GET', url, headers=headers)
+        upstream = await client.send(request, stream=True)
+    except Exception:
+        _semaphore.release()
+        raise
+
+    if upstream.status_code >= 400:
+        await upstream.aclose()
+        _semaphore.release()
+        return Response(content=f"Upstream error: {upstream.status_code}", status_code=502)
+
+    released = False
+
+    async def release():
+        # 生成器结束和响应后台任务都会调用, 只释放一次;
+        # 客户端在首个分块之前断开时生成器不会执行, 由后台任务兜底
+        nonlocal released
+        if released:
+            return
+        released = True
+        try:
+            await upstream.aclose()
+        finally:
+            _semaphore.release()
+
+    async def body():
+        try:
+            async for chunk in upstream.aiter_bytes(CHUNK_SIZE):
+                yield chunk
+        finally:
+            await release()
+
+    response_headers = {
+        name: upstream.headers[name] for name in PASSTHROUGH_HEADERS if name in upstream.headers
+    }
+    return StreamingResponse(
+        body(),
+        status_code=upstream.status_code,
+        headers=response_headers,
+        media_type=guess_content_type(url),
+        background=BackgroundTask(release),
+    )
+
+
+async def download_to_file(url: str, path: str, max_bytes: int) -> int:
+    """下载上游文件到本地路径, 返回字节数; 超过 max_bytes 时抛出 EntryTooLarge"""
+    client = get_client()
+    await _acquire()
+    try:
+        async with client.stream('GET', url, headers={'Accept-Encoding': 'identity'}) as upstream:
+            upstream.raise_for_status()
+            size = 0
+            # 磁盘写入放到线程池, 磁盘卡顿时不阻塞其他代理连接
+            f = await run_in_threadpool(open, path, 'wb')
+            try:
+                async for chunk in upstream.aiter_bytes(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise EntryTooLarge(url)
+                    await run_in_threadpool(f.write, chunk)
+            finally:
+                await run_in_threadpool(f.close)
+            return size
+    finally:
+        _semaphore.release()
+
+
+def _parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """解析单段 Range 头, 返回闭区间 (start, end); 无效时返回 None"""
+    match = RANGE_PATTERN.match((range_header or '').strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    start, end = match.group(1), match.group(2)
+    if not start:
+        length = int(end)
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    return start, end
+
+
+def _read_range(path: str, start: int, length: int) -> bytes:
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return f.read(length)
+
+
+async def file_response(path: str, size: int, content_type: str, range_header: Optional[str] = None) -> Response:
+    """
+    从本地缓存文件返回响应, 支持单段 Range 请求
+    文件在返回响应前打开, 之后被缓存淘汰删除也能读完; 打开前已被删除时抛出 FileNotFoundError
+    """
+    byte_range = _parse_range(range_header, size) if range_header else None
+    if byte_range is None:
+        f = await run_in_threadpool(open, path, 'rb')
+
+        async def body():
+            try:
+                while True:
+                    chunk = await run_in_threadpool(f.read, CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+            finally:
+                await run_in_threadpool(f.close)
+
+        return StreamingResponse(
+            body(),
+            media_type=content_type,
+            headers={'Accept-Ranges': 'bytes', 'Content-Length': str(size)},
+            # 客户端在首个分块之前断开时生成器不会执行, 由后台任务关闭文件
+            background=BackgroundTask(f.close),
+        )
+
+    start, end = byte_range
+    if start >= size or start > end:
+        return Response(status_code=416, headers={'Content-Range': f'bytes */{size}'})
+    content = await run_in_threadpool(_read_range, path, start, end - start + 1)
+    return Response(
+        content=content,
+        status_code=206,
+        media_type=content_type,
+        headers={'Content-Range': f'bytes {start}-{end}/{size}', 'Accept-Ranges': 'bytes'},
+    )
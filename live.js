@@ -1,5 +1,8 @@
 import httpRequest from '../request/index'
 
+// 观众标识 (每次打开页面生成), 刷新直播详情时作为心跳上报, 用于统计在线人数
+const viewerId = Math.random().toString(36).slice(2) + Date.now().toString(36)
+
 // 获取直播列表
 export function getLiveStreams(params) {
     return httpRequest({
@@ -34,11 +37,21 @@ export function deleteLiveStream(streamId) {
     })
 }
 
-// 获取直播详情
+// 获取直播详情 (同时作为在线心跳)
 export function getLiveStreamDetail(streamId) {
     return httpRequest({
         url: `/live/stream/${streamId}`,  
-        method: 'get'
+        method: 'get',
+        params: { viewer_id: viewerId }
+    })
+}
+
+// 离开直播间
+export function leaveLiveStream(streamId) {
+    return httpRequest({
+        url: `/live/stream/${streamId}/leave`,
+        method: 'post',
+        params: { viewer_id: viewerId }
     })
 }
 
@@ -59,10 +72,24 @@ export function addLiveComment(data) {
     })
 }
 
-// 获取评论
-export function getLiveComments(streamId) {
+// 获取评论 (params: after_id / before_id / limit, 默认返回最新的 50 条)
+export function getLiveComments(streamId, params) {
     return httpRequest({
         url: `/live/comments/${streamId}`,  
-        method: 'get'
+        method: 'get',
+        params: params
     })
+}
+
+// 直播间实时聊天 (WebSocket), lastId 为已收到的最后一条评论 ID
+export function getLiveChatSocketUrl(streamId, lastId) {
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:'
+    const query = lastId ? `?last_id=${lastId}` : ''
+    return `${protocol}//${window.location.host}/api/live/ws/${streamId}${query}`
+}
+
+// 直播间实时聊天 (SSE 降级)
+export function getLiveChatEventsUrl(streamId, lastId) {
+    const query = lastId ? `?last_id=${lastId}` : ''
+    return `/api/live/events/${streamId}${query}`
 }
\ No newline at end of file
@@ -1,9 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional, Dict, Any
-from app.database import get_db
-from app import models, schemas
+from app.database import get_db, get_async_db
+from app import models, schemas, crud
+from app.live_counters import live_counters
+from app.live_chat import chat_hub, load_comments, query_comments, serialize_comment, HISTORY_LIMIT, MAX_PAGE_SIZE
 from app.security import get_current_user 
+import asyncio
+import json
 import secrets
 import datetime
 from fastapi import status
@@ -69,7 +76,7 @@ def normalize_category(raw):
 async def get_live_streams(
     page: int = Query(1, ge=1),
     pageSize: int = Query(20, ge=1, le=100),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取直播流列表 - 修复时间显示"""
     try:
@@ -78,20 +85,25 @@ async def get_live_streams(
         # 计算偏移量
         offset = (page - 1) * pageSize
         
-        # 查询直播流
-        streams = db.query(models.LiveStream).filter(
-            models.LiveStream.status == 1  # 只返回活跃的直播
-        ).offset(offset).limit(pageSize).all()
+        # 查询直播流 (主播一并 JOIN 加载)
+        result = await db.execute(
+            select(models.LiveStream).options(
+                joinedload(models.LiveStream.user)
+            ).where(
+                models.LiveStream.status == 1  # 只返回活跃的直播
+            ).offset(offset).limit(pageSize)
+        )
+        streams = result.scalars().all()
         
         print(f"从数据库找到 {len(streams)} 个直播流")
         
+        # 一次查询取回本页所有直播的评论数
+        comment_counts = await crud.get_live_comment_counts_async(db, [stream.id for stream in streams])
+        
         # 构建响应数据
         stream_list = []
         for stream in streams:
-            # 获取评论数量
-            comment_count = db.query(models.LiveComment).filter(
-                models.LiveComment.live_stream_id == stream.id
-            ).count()
+            comment_count = comment_counts.get(stream.id, 0)
             
             # 🔥 修复：UTC时间转北京时间
             display_created_time = "未知时间"
@@ -108,10 +120,10 @@ async def get_live_streams(
                 "cover": stream.cover_image or "/api/imgs/live-default.svg",
                 "category": "live",
                 "status": stream.status,
-                "viewer_count": stream.viewer_count or 0,
+                "viewer_count": live_counters.viewer_count(stream),
                 "streamer": stream.user.name if stream.user else "未知主播",
                 "avatar": "/api/imgs/avatar-default.jpg",
-                "likes": 0,
+                "likes": live_counters.likes(stream),
                 "chat_count": comment_count,
                 "created_time": display_created_time  # 🔥 使用转换后的时间
             }
@@ -246,9 +258,13 @@ async def create_live_stream(
 @router.get("/stream/{stream_id}", response_model=schemas.LiveStreamDetailResponse)
 async def get_live_stream_detail(
     stream_id: int,
+    viewer_id: Optional[str] = Query(None, max_length=64),
     db: Session = Depends(get_db)
 ):
-    """获取直播详情 - 修复时间显示"""
+    """
+    获取直播详情 - 修复时间显示
+    viewer_id: 观众标识, 定时刷新详情即作为心跳维持在线状态
+    """
     try:
         print(f"=== 获取直播详情 API 被调用: stream_id={stream_id} ===")
         
@@ -260,9 +276,8 @@ async def get_live_stream_detail(
                 detail="直播流不存在"
             )
         
-        # 增加观看人数
-        stream.viewer_count = (stream.viewer_count or 0) + 1
-        db.commit()
+        # 增加观看人数 (进程内累加, 定时批量写回)
+        live_counters.heartbeat(stream.id, viewer_id)
         
         # 获取主播名称
         streamer_name = '未知主播'
@@ -300,11 +315,13 @@ async def get_live_stream_detail(
             'cover': stream.cover_image or '/api/imgs/live-default.svg',
             'category': 'live',
             'status': stream.status,
-            'viewer_count': stream.viewer_count,
+            'viewer_count': live_counters.viewer_count(stream),
+            'online_count': live_counters.online_count(stream.id),
+            'max_viewers': live_counters.max_viewers(stream),
             'streamer': streamer_name,
             'streamer_name': streamer_name,
             'avatar': '/api/imgs/avatar-default.jpg',
-            'likes': 0,
+            'likes': live_counters.likes(stream),
             'chat_count': chat_count,
             'created_time': display_created_time,  # 🔥 使用转换后的时间
             'stream_key': stream.stream_key,
@@ -395,20 +412,23 @@ async def like_live_stream(
         print(f"=== 点赞直播 API 被调用: stream_id={stream_id} ===")
         
         stream = db.query(models.LiveStream).filter(models.LiveStream.id == stream_id).first()
-        if stream:
-            # 🔥 数据库中没有 likes 字段，暂时返回模拟数据
-            # TODO: 如果需要真实点赞功能，需要在数据库添加 likes 字段
-            likes = 1  # 模拟点赞成功
-            print(f"⚠️ 点赞功能暂未实现（数据库缺少 likes 字段），返回模拟数据")
-        else:
-            likes = 1  # 模拟点赞
+        if not stream:
+            raise HTTPException(
+                status_code=404,
+                detail="直播流不存在"
+            )
+        
+        # 进程内累加, 定时批量写回
+        live_counters.like(stream.id)
         
         return {
             'code': 200,
-            'data': {'likes': likes},
+            'data': {'likes': live_counters.likes(stream)},
             'message': '点赞成功'
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"点赞直播错误: {str(e)}")
         raise HTTPException(
@@ -526,6 +546,9 @@ async def add_live_comment(
         db.commit()
         db.refresh(comment)
         
+        # 推送给直播间内的所有实时连接
+        chat_hub.publish(comment_data.stream_id, serialize_comment(comment))
+        
         print(f"✅ 评论创建成功: 直播ID={comment_data.stream_id}, 用户ID={current_user.id}, 内容={comment_data.content}")
         
         return {
@@ -550,42 +573,35 @@ async def add_live_comment(
 @router.get("/comments/{stream_id}", response_model=schemas.LiveCommentListResponse)
 async def get_live_comments(
     stream_id: int,
+    after_id: Optional[int] = Query(None, ge=0),
+    before_id: Optional[int] = Query(None, ge=1),
+    limit: int = Query(HISTORY_LIMIT, ge=1, le=MAX_PAGE_SIZE),
     db: Session = Depends(get_db)
 ):
-    """获取直播评论 - 修复时间显示"""
+    """
+    获取直播评论 - 按评论 ID 游标分页
+    默认返回最新的 limit 条; after_id 增量获取新评论; before_id 向前翻看历史
+    """
     try:
-        print(f"=== 获取直播评论 API 被调用: stream_id={stream_id} ===")
+        print(f"=== 获取直播评论 API 被调用: stream_id={stream_id}, after_id={after_id}, before_id={before_id} ===")
         
-        comments = db.query(models.LiveComment).filter(
-            models.LiveComment.live_stream_id == stream_id
-        ).order_by(models.LiveComment.timestamp.asc()).all()
+        comments, has_older = query_comments(db, stream_id, after_id, before_id, limit)
         
-        comment_list = []
-        for comment in comments:
-            user_name = comment.user.name if comment.user else '匿名用户'
-            
-            # 🔥 修复：UTC时间转北京时间
-            display_time = "未知时间"
-            if comment.timestamp:
-                from datetime import timedelta
-                beijing_time = comment.timestamp + timedelta(hours=8)
-                display_time = beijing_time.strftime('%H:%M')
-            
-            comment_list.append({
-                'id': comment.id,
-                'username': user_name,
-                'avatar': '/api/imgs/avatar-default.jpg',
-                'content': comment.content,
-                'time': display_time,  # 🔥 使用转换后的时间
-                'isOwn': False,
-                'isSystem': False
-            })
+        # 🔥 修复：UTC时间转北京时间
+        comment_list = [serialize_comment(comment) for comment in comments]
         
         print(f"返回 {len(comment_list)} 条评论")
+        # 历史页不提供 next_cursor, 客户端继续用最新一页 / 增量页的游标轮询新评论
+        if before_id is not None:
+            next_cursor = None
+        else:
+            next_cursor = comment_list[-1]['id'] if comment_list else after_id
         return {
             'code': 200, 
             'data': comment_list, 
-            'message': 'success'
+            'message': 'success',
+            'next_cursor': next_cursor,
+            'prev_cursor': comment_list[0]['id'] if has_older else None
         }
         
     except Exception as e:
@@ -594,6 +610,115 @@ async def get_live_comments(
             status_code=500,
             detail=f'获取评论失败: {str(e)}'
         )
+
+@router.post("/stream/{stream_id}/leave", response_model=schemas.BaseResponse)
+async def leave_live_stream(
+    stream_id: int,
+    viewer_id: str = Query(..., max_length=64)
+):
+    """观众离开直播间 - 立即移出在线列表 (未调用时按心跳超时过期)"""
+    live_counters.leave(stream_id, viewer_id)
+    return {
+        'code': 200,
+        'message': 'success'
+    }
+
+# ==================== 实时聊天 ====================
+
+# SSE 心跳间隔 (秒), 防止代理因空闲断开连接
+SSE_KEEPALIVE_SECONDS = 15
+
+@router.websocket("/ws/{stream_id}")
+async def live_chat_websocket(
+    websocket: WebSocket,
+    stream_id: int,
+    last_id: Optional[int] = None
+):
+    """
+    直播间实时聊天 - WebSocket
+    连接后先推送历史 (携带 last_id 时只补齐之后的评论), 之后只推送新评论
+    """
+    await websocket.accept()
+    # 先订阅再查库, 避免两者之间产生的评论丢失; 重复的按 ID 去重
+    queue = chat_hub.subscribe(stream_id)
+    sent_id = last_id or 0
+    
+    async def sender():
+        nonlocal sent_id
+        for item in await load_comments(stream_id, last_id):
+            await websocket.send_json({'type': 'comment', 'data': item})
+            sent_id = max(sent_id, item['id'])
+        while True:
+            item = await queue.get()
+            if item is None:
+                # 积压过多被断开, 客户端重连后补齐
+                await websocket.close(code=1013)
+                return
+            if item['id'] <= sent_id:
+                continue
+            await websocket.send_json({'type': 'comment', 'data': item})
+            sent_id = item['id']
+    
+    async def receiver():
+        # 客户端无需发送消息, 这里只用于感知断开
+        while True:
+            await websocket.receive_text()
+    
+    tasks = [asyncio.ensure_future(sender()), asyncio.ensure_future(receiver())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        chat_hub.unsubscribe(stream_id, queue)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+@router.get("/events/{stream_id}")
+async def live_chat_events(
+    stream_id: int,
+    request: Request,
+    last_id: Optional[int] = Query(None)
+):
+    """
+    直播间实时聊天 - SSE (不支持 WebSocket 时的降级方案)
+    浏览器重连时会自动携带 Last-Event-ID, 从该 ID 之后继续推送
+    """
+    last_event_id = request.headers.get('last-event-id')
+    if last_event_id and last_event_id.isdigit():
+        last_id = int(last_event_id)
+    
+    queue = chat_hub.subscribe(stream_id)
+    
+    def event(item: dict) -> str:
+        return f"id: {item['id']}\nevent: comment\ndata: {json.dumps(item, ensure_ascii=False)}\n\n"
+    
+    async def stream():
+        sent_id = last_id or 0
+        try:
+            for item in await load_comments(stream_id, last_id):
+                yield event(item)
+                sent_id = max(sent_id, item['id'])
+            while not await request.is_disconnected():
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if item is None:
+                    return
+                if item['id'] <= sent_id:
+                    continue
+                yield event(item)
+                sent_id = item['id']
+        finally:
+            chat_hub.unsubscribe(stream_id, queue)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 # ==================== 管理员专用接口 ====================
 
 @router.get("/admin/streams", response_model=schemas.LiveStreamListResponse)
@@ -635,18 +760,18 @@ async def get_all_live_streams(
         # 获取总数
         total = query.count()
         
-        # 获取分页数据
-        streams = query.offset(offset).limit(pageSize).all()
+        # 获取分页数据 (主播一并 JOIN 加载)
+        streams = query.options(joinedload(models.LiveStream.user)).offset(offset).limit(pageSize).all()
         
         print(f"管理员获取到 {len(streams)} 个直播流")
         
+        # 一次查询取回本页所有直播的评论数
+        comment_counts = crud.get_live_comment_counts(db, [stream.id for stream in streams])
+        
         # 构建响应数据
         stream_list = []
         for stream in streams:
-            # 获取评论数量
-            comment_count = db.query(models.LiveComment).filter(
-                models.LiveComment.live_stream_id == stream.id
-            ).count()
+            comment_count = comment_counts.get(stream.id, 0)
             
             # 获取主播名称
             streamer_name = '未知主播'
@@ -662,12 +787,12 @@ async def get_all_live_streams(
                 "category": "live",
                 "status": stream.status,
                 "status_text": "直播中" if stream.status == 1 else "已结束",
-                "viewer_count": stream.viewer_count or 0,
-                "max_viewers": stream.max_viewers or 0,
+                "viewer_count": live_counters.viewer_count(stream),
+                "max_viewers": live_counters.max_viewers(stream),
                 "streamer": streamer_name,
                 "streamer_id": stream.user_id,
                 "avatar": "/api/imgs/avatar-default.jpg",
-                "likes": 0,
+                "likes": live_counters.likes(stream),
                 "chat_count": comment_count,
                 "comment_count": comment_count,
                 "stream_key": stream.stream_key,
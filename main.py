@@ -7,8 +7,14 @@ load_dotenv()
 
 import uvicorn
 from fastapi import FastAPI
-from app.database import engine
-from app import models
+from app.database import engine, async_engine
+from app import models, hls_proxy
+from app.prefetch import prefetcher
+from app.segment_cache import segment_cache
+from app.cdn_health import cdn_health
+from app.live_counters import live_counters
+from app.password_hasher import password_hasher
+from app.task.sync_scheduler import sync_scheduler
 from app.routers import videos
 from app.routers import auth
 from app.routers import comments
@@ -59,6 +65,52 @@ app.include_router(collection.router)
 app.include_router(live.router)
 app.include_router(admin.router)
 app.include_router(ai_search.router)
+
+@app.on_event("startup")
+async def start_cdn_health():
+    # 启动 CDN 健康探测
+    cdn_health.start()
+
+@app.on_event("startup")
+async def load_segment_cache():
+    # 在后台线程中重建 HLS 磁盘缓存索引
+    segment_cache.start()
+
+@app.on_event("startup")
+async def start_live_counters():
+    # 启动直播计数定时写回
+    live_counters.start()
+
+@app.on_event("startup")
+async def start_sync_scheduler():
+    # 启动片库增量同步调度 (CATALOG_SYNC_ENABLED=1 时)
+    sync_scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_sync_scheduler():
+    await sync_scheduler.stop()
+
+@app.on_event("shutdown")
+async def flush_live_counters():
+    # 写回剩余的观看/点赞增量
+    await live_counters.stop()
+
+@app.on_event("shutdown")
+async def close_password_hasher():
+    password_hasher.shutdown()
+
+@app.on_event("shutdown")
+async def close_hls_proxy():
+    # 停止后台任务并关闭 HLS 代理的共享连接池
+    await cdn_health.stop()
+    await prefetcher.close()
+    await hls_proxy.close_client()
+
+@app.on_event("shutdown")
+async def close_async_engine():
+    # 释放异步数据库连接池
+    await async_engine.dispose()
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the FastFlix API!"}
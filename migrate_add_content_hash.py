@@ -0,0 +1,22 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import inspect, text
+from app.database import engine
+
+
+def add_content_hash_column():
+    """为老的 sakura_movdetail 表补充内容摘要字段, 已有数据在下次同步时写入摘要"""
+    columns = {column['name'] for column in inspect(engine).get_columns('sakura_movdetail')}
+    if 'content_hash' in columns:
+        print("✅ 字段 content_hash 已存在")
+        return
+    with engine.begin() as conn:
+        print("🔧 添加字段 content_hash")
+        conn.execute(text("ALTER TABLE sakura_movdetail ADD COLUMN content_hash VARCHAR(40) NULL"))
+    print("✅ 迁移完成")
+
+
+if __name__ == '__main__':
+    add_content_hash_column()
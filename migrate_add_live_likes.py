@@ -0,0 +1,22 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import inspect, text
+from app.database import engine
+
+
+def add_live_likes_column():
+    """为老的 sakura_live_stream 表补充点赞数字段"""
+    columns = {column['name'] for column in inspect(engine).get_columns('sakura_live_stream')}
+    if 'likes' in columns:
+        print("✅ 字段 likes 已存在")
+        return
+    with engine.begin() as conn:
+        print("🔧 添加字段 likes")
+        conn.execute(text("ALTER TABLE sakura_live_stream ADD COLUMN likes INT NOT NULL DEFAULT 0"))
+    print("✅ 迁移完成")
+
+
+if __name__ == '__main__':
+    add_live_likes_column()
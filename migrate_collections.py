@@ -0,0 +1,68 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import datetime
+from app.database import engine, SessionLocal
+from app import models
+
+
+def parse_id_list(raw):
+    """解析旧格式 "12;34;56;", 保持收藏顺序并去重"""
+    vod_ids = []
+    for part in (raw or '').split(';'):
+        part = part.strip()
+        if part.isdigit() and int(part) not in vod_ids:
+            vod_ids.append(int(part))
+    return vod_ids
+
+
+def migrate_collections():
+    """
+    把 sakura_user_collection 中以分号拼接的收藏 ID 拆分到 sakura_user_collection_item
+    可重复执行: 已迁移的 (user_id, movdetail_id) 会跳过
+    """
+    models.UserCollectionItem.__table__.create(bind=engine, checkfirst=True)
+
+    db = SessionLocal()
+    try:
+        existing_movs = {mov_id for (mov_id,) in db.query(models.MovDetail.id).all()}
+        # 旧数据没有收藏时间, 按原列表顺序依次递增, 保证越晚收藏越靠前
+        base_time = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+
+        total = 0
+        for collection in db.query(models.UserCollection).all():
+            if not collection.user_id:
+                continue
+            migrated = {
+                mov_id for (mov_id,) in db.query(models.UserCollectionItem.movdetail_id).filter(
+                    models.UserCollectionItem.user_id == collection.user_id
+                ).all()
+            }
+            items = []
+            for index, vod_id in enumerate(parse_id_list(collection.movdetail_id_list)):
+                if vod_id in migrated or vod_id not in existing_movs:
+                    continue
+                items.append({
+                    'user_id': collection.user_id,
+                    'movdetail_id': vod_id,
+                    'created_at': base_time + datetime.timedelta(seconds=index),
+                })
+                migrated.add(vod_id)
+            if items:
+                db.bulk_insert_mappings(models.UserCollectionItem, items)
+                db.commit()
+                total += len(items)
+                print(f"✅ 用户 {collection.user_id}: 迁移 {len(items)} 条收藏")
+
+        print(f"🎉 迁移完成, 共 {total} 条收藏")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ 迁移失败: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    migrate_collections()
@@ -0,0 +1,32 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import inspect
+from app.database import engine
+from app import models
+
+
+def sync_indexes():
+    """
+    为已存在的表补建模型中声明的索引
+    create_all 只会在新建表时创建索引, 老表需要通过此脚本补齐
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    for table in models.Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            print(f"🔧 创建索引: {table.name}.{index.name}")
+            index.create(bind=engine)
+
+    print("✅ 索引同步完成")
+
+
+if __name__ == '__main__':
+    sync_indexes()
@@ -0,0 +1,40 @@
+import base64
+import datetime
+import json
+from typing import Any, List, Optional
+
+from fastapi import HTTPException
+
+# 游标分页（keyset）工具
+# 游标是对排序键的不透明编码，客户端只负责原样回传
+
+
+def encode_cursor(*values: Any) -> str:
+    """将排序键编码为 URL 安全的游标字符串"""
+    payload = []
+    for value in values:
+        if isinstance(value, datetime.datetime):
+            payload.append({"t": value.strftime("%Y-%m-%d %H:%M:%S.%f")})
+        else:
+            payload.append(value)
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[List[Any]]:
+    """解析游标，返回排序键列表；游标非法时抛出 400"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(payload, list) or len(payload) != size:
+            raise ValueError("cursor size mismatch")
+        values = []
+        for value in payload:
+            if isinstance(value, dict) and "t" in value:
+                value = datetime.datetime.strptime(value["t"], "%Y-%m-%d %H:%M:%S.%f")
+            values.append(value)
+        return values
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="cursor 参数无效")
@@ -0,0 +1,87 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from app import security
+
+# 密码哈希执行器
+# bcrypt / pbkdf2 计算耗时几十到上百毫秒, 放到独立的有界线程池中执行, 不阻塞事件循环;
+# 同时执行的数量受 HASH_CONCURRENCY 限制, 排队超过 HASH_MAX_QUEUE 时直接拒绝,
+# 避免登录高峰拖慢视频和聊天请求
+
+HASH_CONCURRENCY = int(os.getenv("PASSWORD_HASH_CONCURRENCY", "4"))
+HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
+
+class HashQueueFull(Exception):
+    """等待哈希计算的请求过多"""
+
+
+class PasswordHasher:
+    def __init__(self, concurrency: int, max_queue: int):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="password-hash")
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.waiting = 0
+        self.running = 0
+        self.counters = {
+            'completed': 0,
+            'rejected': 0,
+            'rehashed': 0,
+            'max_queue_depth': 0,
+            'wait_ms_total': 0.0,
+            'run_ms_total': 0.0,
+        }
+
+    async def _run(self, func, *args):
+        if self.waiting >= self.max_queue:
+            self.counters['rejected'] += 1
+            raise HashQueueFull("密码校验排队过多")
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        self.counters['max_queue_depth'] = max(self.counters['max_queue_depth'], self.waiting)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        started = time.perf_counter()
+        self.running += 1
+        try:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+            self.counters['completed'] += 1
+            self.counters['wait_ms_total'] += (started - queued_at) * 1000
+            self.counters['run_ms_total'] += (time.perf_counter() - started) * 1000
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(security.verify_password, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(security.get_password_hash, password)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        completed = self.counters['completed']
+        return {
+            **self.counters,
+            'concurrency': self.concurrency,
+            'queue_depth': self.waiting,
+            'running': self.running,
+            'avg_wait_ms': round(self.counters['wait_ms_total'] / completed, 2) if completed else 0.0,
+            'avg_run_ms': round(self.counters['run_ms_total'] / completed, 2) if completed else 0.0,
+        }
+
+
+password_hasher = PasswordHasher(HASH_CONCURRENCY, HASH_MAX_QUEUE)
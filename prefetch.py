@@ -0,0 +1,114 @@
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Dict, List, Set, Tuple
+
+from app.segment_cache import segment_cache
+
+# HLS 分片预读
+# 代理播放列表时记录分片顺序, 在播放列表被请求和每个分片命中时,
+# 后台把接下来的 K 个分片预热进代理缓存, 削平上游延迟抖动导致的卡顿
+
+PREFETCH_ENABLED = os.getenv("HLS_PREFETCH_ENABLED", "0") == "1"
+PREFETCH_SEGMENTS = int(os.getenv("HLS_PREFETCH_SEGMENTS", "3"))
+PER_STREAM_CONCURRENCY = int(os.getenv("HLS_PREFETCH_PER_STREAM", "2"))
+GLOBAL_CONCURRENCY = int(os.getenv("HLS_PREFETCH_GLOBAL", "16"))
+MAX_TRACKED_PLAYLISTS = int(os.getenv("HLS_PREFETCH_MAX_PLAYLISTS", "512"))
+
+
+class Prefetcher:
+    def __init__(self, enabled: bool, depth: int, per_stream: int, global_limit: int, max_playlists: int):
+        self.enabled = enabled
+        self.depth = depth
+        self.per_stream = per_stream
+        self.global_limit = global_limit
+        self.max_playlists = max_playlists
+        # 播放列表 -> 有序分片列表
+        self._playlists: "OrderedDict[str, List[str]]" = OrderedDict()
+        # 分片 -> (播放列表, 序号)
+        self._positions: Dict[str, Tuple[str, int]] = {}
+        self._active: Dict[str, int] = {}
+        self._active_total = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self.counters = {'scheduled': 0, 'completed': 0, 'failed': 0, 'skipped_busy': 0}
+
+    def register_playlist(self, playlist_url: str, segment_urls: List[str]) -> None:
+        """记录播放列表中的分片顺序, 并预热开头的分片"""
+        if not self.enabled or not segment_urls:
+            return
+        if self._playlists.get(playlist_url) is segment_urls:
+            # 播放列表未变化 (来自内存缓存), 只需重新预热
+            self._playlists.move_to_end(playlist_url)
+            self._schedule(playlist_url, 0)
+            return
+        self._forget(playlist_url)
+        self._playlists[playlist_url] = segment_urls
+        for index, segment_url in enumerate(segment_urls):
+            self._positions[segment_url] = (playlist_url, index)
+        while len(self._playlists) > self.max_playlists:
+            self._forget(next(iter(self._playlists)))
+        self._schedule(playlist_url, 0)
+
+    def on_segment(self, segment_url: str) -> None:
+        """分片被请求时预热其后的分片"""
+        if not self.enabled:
+            return
+        position = self._positions.get(segment_url)
+        if position is None:
+            return
+        playlist_url, index = position
+        self._playlists.move_to_end(playlist_url)
+        self._schedule(playlist_url, index + 1)
+
+    def _forget(self, playlist_url: str) -> None:
+        for segment_url in self._playlists.pop(playlist_url, []):
+            if self._positions.get(segment_url, (None,))[0] == playlist_url:
+                del self._positions[segment_url]
+
+    def _schedule(self, playlist_url: str, start: int) -> None:
+        for segment_url in self._playlists[playlist_url][start:start + self.depth]:
+            if segment_cache.lookup(segment_url) is not None:
+                continue
+            if self._active.get(playlist_url, 0) >= self.per_stream or self._active_total >= self.global_limit:
+                self.counters['skipped_busy'] += 1
+                return
+            self._active[playlist_url] = self._active.get(playlist_url, 0) + 1
+            self._active_total += 1
+            self.counters['scheduled'] += 1
+            task = asyncio.ensure_future(self._warm(playlist_url, segment_url))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _warm(self, playlist_url: str, segment_url: str) -> None:
+        try:
+            await segment_cache.fetch(segment_url)
+            self.counters['completed'] += 1
+        except Exception as e:
+            self.counters['failed'] += 1
+            print(f"⚠️ 分片预读失败: {segment_url} ({e})")
+        finally:
+            self._active_total -= 1
+            remaining = self._active.get(playlist_url, 1) - 1
+            if remaining > 0:
+                self._active[playlist_url] = remaining
+            else:
+                self._active.pop(playlist_url, None)
+
+    async def close(self) -> None:
+        """取消未完成的预读任务, 在应用关闭时调用"""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            'enabled': self.enabled,
+            'active': self._active_total,
+            'tracked_playlists': len(self._playlists),
+        }
+
+
+prefetcher = Prefetcher(PREFETCH_ENABLED, PREFETCH_SEGMENTS, PER_STREAM_CONCURRENCY,
+                        GLOBAL_CONCURRENCY, MAX_TRACKED_PLAYLISTS)
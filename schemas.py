@@ -52,7 +52,10 @@ class CommentResponse(BaseModel):
     user_name: str
     body: str
     time: Optional[str] = None
+    user_id: Optional[int] = None
     reply_list: List[dict] = []
+    # 回复总数, 超过内联上限时 reply_list 只包含前一部分
+    reply_count: int = 0
 
     class Config:
         orm_mode = True
@@ -61,6 +64,13 @@ class CommentListResponse(BaseModel):
     code: int
     data: List[CommentResponse]
     message: str
+    # 主评论总数
+    total: int = 0
+
+class CommentReplyListResponse(BaseModel):
+    code: int
+    data: List[dict]
+    message: str
     
 
 
@@ -74,6 +84,7 @@ class VodListResponse(BaseModel):
     code: int
     message: str
     data: List[VodItem]
+    next_cursor: Optional[str] = None  # 游标分页: 下一页游标, 为空表示没有更多
 
 class VodDetailResponse(BaseModel):
     code: int
@@ -92,6 +103,8 @@ class PaginationInfo(BaseModel):
     per_page: int
     total: int
     has_more: bool
+    # 下一页游标, 传回 cursor 参数即可继续加载
+    next_cursor: Optional[str] = None
 
 class CollectionData(BaseModel):
     collections: List[CollectionItem]
@@ -107,6 +120,20 @@ class IsCollectionResponse(BaseModel):
     message: str
     data: int
 
+class IsCollectionBatchRequest(BaseModel):
+    vod_ids: List[int]
+
+class IsCollectionBatchData(BaseModel):
+    # 已收藏的影片 ID
+    collected: List[int]
+    # 与请求的 vod_ids 一一对应, 1=已收藏 0=未收藏
+    bitmap: List[int]
+
+class IsCollectionBatchResponse(BaseModel):
+    code: int
+    message: str
+    data: IsCollectionBatchData
+
 class CollectionCreate(BaseModel):
     vod_id: int
 
@@ -170,6 +197,8 @@ class LiveStreamDetail(BaseModel):
     push_url: Optional[str] = None
     stream_key: Optional[str] = None
     likes: int
+    online_count: int = 0
+    max_viewers: int = 0
     description: Optional[str] = None
     tags: Optional[str] = None
     created_at: Optional[str] = None
@@ -209,4 +238,8 @@ class LiveCommentResponse(BaseModel):
 class LiveCommentListResponse(BaseModel):
     code: int
     data: List[LiveCommentItem]
-    message: str
\ No newline at end of file
+    message: str
+    # 最新一条评论的 ID, 作为 after_id 增量获取新评论
+    next_cursor: Optional[int] = None
+    # 还有更早的评论时为最早一条的 ID, 作为 before_id 向前翻页
+    prev_cursor: Optional[int] = None
\ No newline at end of file
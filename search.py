@@ -0,0 +1,177 @@
+import re
+import unicodedata
+from typing import Iterable, List, Set, Tuple
+
+from sqlalchemy import false, func, select
+from sqlalchemy.orm import Session
+
+from app import models
+
+# 片库关键词搜索 - 倒排索引
+# 中文标题按 n-gram(单字 + 二元组) 切分, vod_en(拼音/英文) 按单词前缀切分,
+# 倒排表存放在 sakura_search_term, 查询只读取命中词项的倒排链, 与片库总量无关
+
+CJK_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+WORD_PATTERN = re.compile(r'[0-9a-z]+')
+MAX_TERM_LENGTH = 32
+MAX_QUERY_TERMS = 16
+
+# 各字段命中权重
+NAME_WEIGHT = 3
+EN_WEIGHT = 2
+
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def tokenize(text: str) -> Set[str]:
+    """索引切词: 中文单字 + 二元组, 英文/拼音单词的全部前缀"""
+    text = _normalize(text)
+    terms = set()
+    for run in CJK_PATTERN.findall(text):
+        terms.update(run)
+        terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    for word in WORD_PATTERN.findall(text):
+        word = word[:MAX_TERM_LENGTH]
+        terms.update(word[:n] for n in range(min(2, len(word)), len(word) + 1))
+    return terms
+
+
+def query_terms(keyword: str) -> List[str]:
+    """查询切词: 中文取二元组(单字词取单字), 英文/拼音取整词(命中索引中的前缀)"""
+    keyword = _normalize(keyword)
+    terms = []
+    for run in CJK_PATTERN.findall(keyword):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    for word in WORD_PATTERN.findall(keyword):
+        terms.append(word[:MAX_TERM_LENGTH])
+    # 去重并保持顺序
+    return list(dict.fromkeys(terms))[:MAX_QUERY_TERMS]
+
+
+def _build_postings(movdetail_id: int, vod_name: str, vod_en: str) -> List[dict]:
+    weights = {}
+    for term in tokenize(vod_en):
+        weights[term] = EN_WEIGHT
+    for term in tokenize(vod_name):
+        weights[term] = NAME_WEIGHT
+    return [
+        {'term': term, 'movdetail_id': movdetail_id, 'weight': weight}
+        for term, weight in weights.items()
+    ]
+
+
+def _index_rows(db: Session, rows: Iterable[Tuple[int, str, str]]) -> int:
+    rows = list(rows)
+    if not rows:
+        return 0
+    ids = [row[0] for row in rows]
+    db.query(models.SearchTerm).filter(
+        models.SearchTerm.movdetail_id.in_(ids)
+    ).delete(synchronize_session=False)
+    postings = []
+    for movdetail_id, vod_name, vod_en in rows:
+        postings.extend(_build_postings(movdetail_id, vod_name, vod_en))
+    if postings:
+        db.bulk_insert_mappings(models.SearchTerm, postings)
+    return len(rows)
+
+
+def _movdetail_rows_query(db: Session):
+    return db.query(
+        models.MovDetail.id, models.MovDetail.vod_name, models.MovInfo.vod_en
+    ).outerjoin(models.MovInfo, models.MovInfo.vod_id == models.MovDetail.vod_id)
+
+
+def index_movdetail_ids(db: Session, movdetail_ids: Iterable[int]) -> int:
+    """按 sakura_movdetail.id 重建这些影片的索引 (不提交事务)"""
+    movdetail_ids = list(movdetail_ids)
+    if not movdetail_ids:
+        return 0
+    rows = _movdetail_rows_query(db).filter(models.MovDetail.id.in_(movdetail_ids)).all()
+    return _index_rows(db, rows)
+
+
+def index_vod_ids(db: Session, vod_ids: Iterable[int]) -> int:
+    """按上游 vod_id 重建这些影片的索引, 供爬虫入库后调用 (不提交事务)"""
+    vod_ids = [vod_id for vod_id in vod_ids if vod_id is not None]
+    if not vod_ids:
+        return 0
+    rows = _movdetail_rows_query(db).filter(models.MovDetail.vod_id.in_(vod_ids)).all()
+    return _index_rows(db, rows)
+
+
+def remove_movdetail(db: Session, movdetail_id: int) -> None:
+    """删除影片的索引项 (不提交事务)"""
+    db.query(models.SearchTerm).filter(
+        models.SearchTerm.movdetail_id == movdetail_id
+    ).delete(synchronize_session=False)
+
+
+def rebuild_index(db: Session, batch_size: int = 500) -> int:
+    """全量重建索引, 按主键分批提交"""
+    db.query(models.SearchTerm).delete(synchronize_session=False)
+    db.commit()
+
+    total = 0
+    last_id = 0
+    while True:
+        rows = _movdetail_rows_query(db).filter(
+            models.MovDetail.id > last_id
+        ).order_by(models.MovDetail.id).limit(batch_size).all()
+        if not rows:
+            break
+        total += _index_rows(db, rows)
+        db.commit()
+        last_id = rows[-1][0]
+    return total
+
+
+def _match_statement(terms: List[str]):
+    """所有查询词都命中的影片 ID (不排序不分页)"""
+    return select(models.SearchTerm.movdetail_id).where(
+        models.SearchTerm.term.in_(terms)
+    ).group_by(
+        models.SearchTerm.movdetail_id
+    ).having(
+        func.count(models.SearchTerm.term) == len(terms)
+    )
+
+
+def _search_statement(terms: List[str], offset: int, limit: int):
+    score = func.sum(models.SearchTerm.weight)
+    return _match_statement(terms).order_by(
+        score.desc(), models.SearchTerm.movdetail_id.desc()
+    ).offset(offset).limit(limit)
+
+
+def match_condition(keyword: str):
+    """
+    关键词过滤条件, 用于 MovDetail 查询的 filter / where
+    命中集合作为子查询嵌入, 排序、分页和计数都由外层查询完成, 不受命中数量限制
+    """
+    terms = query_terms(keyword)
+    if not terms:
+        return false()
+    return models.MovDetail.id.in_(_match_statement(terms))
+
+
+def search_ids(db: Session, keyword: str, offset: int = 0, limit: int = 12) -> List[int]:
+    """按相关度返回命中的 sakura_movdetail.id 列表, 所有查询词都需命中"""
+    terms = query_terms(keyword)
+    if not terms:
+        return []
+    return db.execute(_search_statement(terms, offset, limit)).scalars().all()
+
+
+def count_matches(db: Session, keyword: str) -> int:
+    """命中影片总数"""
+    terms = query_terms(keyword)
+    if not terms:
+        return 0
+    matched = _match_statement(terms).subquery()
+    return db.query(func.count()).select_from(matched).scalar() or 0
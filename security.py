@@ -1,3 +1,6 @@
+import os
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
 import jwt  # 改为使用 PyJWT
@@ -19,9 +22,29 @@ pwd_context = CryptContext(
     deprecated="auto"
 )
 
+# 新密码使用的 pbkdf2_sha256 迭代次数; 登录时低于该强度的旧哈希会被重新生成
+PBKDF2_ROUNDS = int(os.getenv("PASSWORD_PBKDF2_ROUNDS", "29000"))
+
 # HTTP Bearer 认证
 security = HTTPBearer()
 
+# 已验证用户缓存: token -> (缓存过期时间, 用户快照)
+# 命中时跳过 JWT 解码和用户查询; 管理员修改用户状态/角色时通过 invalidate_user 立即失效
+# (仅对当前进程生效, 其他 worker 最迟在 TTL 后生效)
+PRINCIPAL_CACHE_TTL = int(os.getenv("AUTH_PRINCIPAL_CACHE_TTL", "30"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("AUTH_PRINCIPAL_CACHE_SIZE", "10000"))
+_principal_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+# bcrypt 限制密码不能超过 72 字节
+PASSWORD_MAX_BYTES = 72
+
+def truncate_password(plain_password: str) -> str:
+    """截断到 72 字节; 验证与生成哈希都使用截断后的明文, 两者始终一致"""
+    password_bytes = plain_password.encode('utf-8')
+    if len(password_bytes) <= PASSWORD_MAX_BYTES:
+        return plain_password
+    return password_bytes[:PASSWORD_MAX_BYTES].decode('utf-8', errors='ignore')
+
 def verify_password(plain_password, hashed_password):
     """验证密码 - 支持多种哈希格式，处理密码长度限制"""
     try:
@@ -35,12 +58,10 @@ def verify_password(plain_password, hashed_password):
         # 🔥 修复：处理密码长度限制
         # bcrypt 限制密码不能超过 72 字节
         password_bytes = plain_password.encode('utf-8')
-        if len(password_bytes) > 72:
-            print(f"⚠️ 密码字节长度 {len(password_bytes)} > 72，进行截断")
-            # 截断到 72 字节
-            truncated_bytes = password_bytes[:72]
+        if len(password_bytes) > PASSWORD_MAX_BYTES:
+            print(f"⚠️ 密码字节长度 {len(password_bytes)} > {PASSWORD_MAX_BYTES}，进行截断")
             # 尝试用截断后的密码验证
-            plain_password = truncated_bytes.decode('utf-8', errors='ignore')
+            plain_password = truncate_password(plain_password)
             print(f"✅ 密码已截断为 {len(plain_password)} 字符")
             
         # 1. 首先尝试 bcrypt 格式 ($2b$, $2a$, $2y$)
@@ -83,11 +104,12 @@ def verify_password(plain_password, hashed_password):
         return False
 
 def get_password_hash(password):
-    """生成密码哈希 - 使用 pbkdf2_sha256"""
+    """生成密码哈希 - 使用 pbkdf2_sha256 (与 verify_password 一样先截断到 72 字节)"""
+    password = truncate_password(password)
     try:
         # 使用 pbkdf2_sha256 生成哈希
         from passlib.hash import pbkdf2_sha256
-        hashed = pbkdf2_sha256.hash(password)
+        hashed = pbkdf2_sha256.using(rounds=PBKDF2_ROUNDS).hash(password)
         print(f"🔐 生成密码哈希 (pbkdf2_sha256): {hashed[:50]}...")
         return hashed
     except Exception as e:
@@ -97,6 +119,14 @@ def get_password_hash(password):
         print(f"🔐 降级到 bcrypt 哈希: {hashed[:20]}...")
         return hashed
         
+def password_needs_rehash(hashed_password) -> bool:
+    """旧格式 (bcrypt 等) 或迭代次数与当前配置不符的哈希需要在登录成功后重新生成"""
+    if not hashed_password or not hashed_password.startswith('$pbkdf2-sha256$'):
+        return True
+    # 格式: $pbkdf2-sha256$<迭代次数>$<salt>$<checksum>
+    rounds = hashed_password.split('$')[2]
+    return not rounds.isdigit() or int(rounds) != PBKDF2_ROUNDS
+        
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """创建访问令牌"""
     to_encode = data.copy()
@@ -118,6 +148,37 @@ def verify_token(token: str):
     except jwt.InvalidTokenError:
         return None
 
+def _snapshot_user(user: models.User) -> models.User:
+    """复制用户的列属性, 得到不绑定任何 Session 的对象, 可在请求之间共享"""
+    return models.User(**{
+        column.name: getattr(user, column.name) for column in models.User.__table__.columns
+    })
+
+def _cache_principal(token: str, user: models.User, payload: dict) -> None:
+    expires_at = time.time() + PRINCIPAL_CACHE_TTL
+    # 不超过 token 本身的有效期, 过期后重新走校验
+    if payload.get("exp"):
+        expires_at = min(expires_at, float(payload["exp"]))
+    _principal_cache[token] = (expires_at, _snapshot_user(user))
+    _principal_cache.move_to_end(token)
+    while len(_principal_cache) > PRINCIPAL_CACHE_SIZE:
+        _principal_cache.popitem(last=False)
+
+def _cached_principal(token: str) -> Optional[models.User]:
+    entry = _principal_cache.get(token)
+    if entry is None:
+        return None
+    if entry[0] <= time.time():
+        del _principal_cache[token]
+        return None
+    _principal_cache.move_to_end(token)
+    return entry[1]
+
+def invalidate_user(user_id: int) -> None:
+    """用户状态/角色变化后调用, 清除该用户所有 token 的缓存"""
+    for token in [token for token, (_, user) in _principal_cache.items() if user.id == user_id]:
+        del _principal_cache[token]
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
@@ -136,6 +197,10 @@ async def get_current_user(
         if token.startswith("jwt "):
             token = token[4:]
         
+        cached = _cached_principal(token)
+        if cached is not None:
+            return cached
+        
         payload = verify_token(token)
         if payload is None:
             raise credentials_exception
@@ -156,6 +221,7 @@ async def get_current_user(
                 detail="账户已被禁用"
             )
         
+        _cache_principal(token, user, payload)
         return user
     except Exception as e:
         print(f"认证错误: {e}")
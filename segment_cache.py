@@ -0,0 +1,238 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app import hls_proxy
+from app.cdn_health import cdn_health
+
+# 代理内容的磁盘缓存
+# 以上游 URL 的 sha256 作为键落盘, 按总大小做 LRU 淘汰;
+# 分片不可变, TTL 较长; 播放列表 TTL 较短;
+# 同一分片的并发未命中只触发一次上游下载
+
+CACHE_DIR = os.getenv("HLS_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "hls"))
+CACHE_MAX_BYTES = int(os.getenv("HLS_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+ENTRY_MAX_BYTES = int(os.getenv("HLS_CACHE_ENTRY_MAX_BYTES", str(64 * 1024 * 1024)))
+SEGMENT_TTL = int(os.getenv("HLS_CACHE_SEGMENT_TTL", str(7 * 24 * 3600)))
+PLAYLIST_TTL = int(os.getenv("HLS_CACHE_PLAYLIST_TTL", "600"))
+
+# 可缓存的扩展名 (部分 CDN 会把 TS 分片伪装成图片)
+PLAYLIST_EXTENSIONS = ('.m3u8',)
+SEGMENT_EXTENSIONS = ('.ts', '.m4s', '.mp4', '.aac', '.key', '.jpeg', '.jpg', '.png')
+
+
+class CacheEntry(NamedTuple):
+    path: str
+    size: int
+    content_type: str
+    expires_at: float
+
+
+class SegmentCache:
+    def __init__(self, directory: str, max_bytes: int, entry_max_bytes: int,
+                 segment_ttl: int, playlist_ttl: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entry_max_bytes = entry_max_bytes
+        self.segment_ttl = segment_ttl
+        self.playlist_ttl = playlist_ttl
+        self.total_bytes = 0
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._loaded = False
+        self._load_task: Optional[asyncio.Task] = None
+        self.counters = {
+            'hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'evictions': 0,
+            'expired': 0,
+            'uncacheable': 0,
+            'hit_bytes': 0,
+            'upstream_bytes': 0,
+        }
+
+    # ---------- 键与路径 ----------
+
+    @staticmethod
+    def key_for(url: str) -> str:
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _data_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    @staticmethod
+    def _path_of(url: str) -> str:
+        return url.split('?', 1)[0].lower()
+
+    def is_cacheable(self, url: str) -> bool:
+        return self._path_of(url).endswith(PLAYLIST_EXTENSIONS + SEGMENT_EXTENSIONS)
+
+    def ttl_for(self, url: str) -> int:
+        if self._path_of(url).endswith(PLAYLIST_EXTENSIONS):
+            return self.playlist_ttl
+        return self.segment_ttl
+
+    # ---------- 索引 ----------
+
+    def _scan(self) -> List[Tuple[str, CacheEntry]]:
+        """扫描缓存目录, 按文件修改时间从旧到新返回已有的缓存项 (只读磁盘, 在线程中执行)"""
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.meta'):
+                    continue
+                meta_path = os.path.join(root, name)
+                data_path = meta_path[:-len('.meta')]
+                try:
+                    with open(meta_path, encoding='utf-8') as f:
+                        meta = json.load(f)
+                    mtime = os.path.getmtime(data_path)
+                except (OSError, ValueError):
+                    continue
+                entry = CacheEntry(data_path, meta['size'], meta['content_type'], meta['expires_at'])
+                found.append((mtime, os.path.basename(data_path), entry))
+        return [(key, entry) for _, key, entry in sorted(found)]
+
+    async def load(self) -> None:
+        """
+        在线程池中扫描缓存目录重建索引, 按文件修改时间恢复 LRU 顺序
+        扫描期间新下载的缓存项更新, 保留在 LRU 末尾
+        """
+        found = await run_in_threadpool(self._scan)
+        entries: "OrderedDict[str, CacheEntry]" = OrderedDict(
+            (key, entry) for key, entry in found if key not in self._entries
+        )
+        entries.update(self._entries)
+        self._entries = entries
+        self.total_bytes = sum(entry.size for entry in entries.values())
+        self._loaded = True
+        self._evict()
+
+    def start(self) -> None:
+        """在后台加载磁盘索引, 在应用启动时调用; 加载完成前的查询按未命中处理"""
+        if self._load_task is None:
+            self._load_task = asyncio.ensure_future(self.load())
+
+    def _remove(self, key: str, unlink: bool = True) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.total_bytes -= entry.size
+        if not unlink:
+            return
+        for path in (entry.path, entry.path + '.meta'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _evict(self) -> None:
+        while self.total_bytes > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.counters['evictions'] += 1
+
+    def lookup(self, url: str) -> Optional[CacheEntry]:
+        """只查缓存, 命中时刷新 LRU 位置"""
+        key = self.key_for(url)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < time.time():
+            self._remove(key)
+            self.counters['expired'] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    # ---------- 读取 ----------
+
+    async def fetch(self, url: str) -> CacheEntry:
+        """获取缓存项, 未命中时下载; 并发未命中合并为一次上游请求"""
+        entry = self.lookup(url)
+        if entry is not None:
+            self.counters['hits'] += 1
+            self.counters['hit_bytes'] += entry.size
+            return entry
+
+        key = self.key_for(url)
+        future = self._inflight.get(key)
+        if future is not None:
+            self.counters['coalesced'] += 1
+            return await asyncio.shield(future)
+
+        self.counters['misses'] += 1
+        future = asyncio.ensure_future(self._download(url, key))
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    @staticmethod
+    def _write_meta(url: str, entry: CacheEntry) -> None:
+        with open(entry.path + '.meta', 'w', encoding='utf-8') as f:
+            json.dump({'url': url, 'size': entry.size, 'content_type': entry.content_type,
+                       'expires_at': entry.expires_at}, f)
+
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        with open(path, 'rb') as f:
+            return f.read()
+
+    async def _download(self, url: str, key: str) -> CacheEntry:
+        data_path = self._data_path(key)
+        await run_in_threadpool(os.makedirs, os.path.dirname(data_path), exist_ok=True)
+        tmp_path = f"{data_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            size = await hls_proxy.download_to_file(cdn_health.pick(url), tmp_path, self.entry_max_bytes)
+            await run_in_threadpool(os.replace, tmp_path, data_path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        entry = CacheEntry(data_path, size, hls_proxy.guess_content_type(url), time.time() + self.ttl_for(url))
+        await run_in_threadpool(self._write_meta, url, entry)
+
+        # 同一个键的旧索引项 (例如下载期间启动扫描加入的) 与新文件路径相同, 只移出索引不删除文件
+        self._remove(key, unlink=False)
+        self._entries[key] = entry
+        self.total_bytes += size
+        self.counters['upstream_bytes'] += size
+        self._evict()
+        return entry
+
+    async def read_text(self, url: str) -> str:
+        """通过缓存读取文本内容 (播放列表); 读取前缓存项已被淘汰时直接请求上游"""
+        entry = await self.fetch(url)
+        try:
+            content = await run_in_threadpool(self._read_file, entry.path)
+        except FileNotFoundError:
+            return await hls_proxy.fetch_text(cdn_health.pick(url))
+        return content.decode('utf-8', errors='replace')
+
+    def stats(self) -> dict:
+        lookups = self.counters['hits'] + self.counters['misses'] + self.counters['coalesced']
+        return {
+            **self.counters,
+            'hit_ratio': round(self.counters['hits'] / lookups, 4) if lookups else 0.0,
+            'entries': len(self._entries),
+            'total_bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'inflight': len(self._inflight),
+            'loaded': self._loaded,
+        }
+
+
+segment_cache = SegmentCache(CACHE_DIR, CACHE_MAX_BYTES, ENTRY_MAX_BYTES, SEGMENT_TTL, PLAYLIST_TTL)
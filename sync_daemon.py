@@ -0,0 +1,38 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import asyncio
+import logging
+
+from app.database import engine
+from app import models
+from app.task.sync_scheduler import sync_scheduler
+
+
+def sync_daemon(once=False):
+    """
+    独立运行片库增量同步 (间隔 / 抖动通过 CATALOG_SYNC_* 环境变量配置)
+    once: 只执行一次后退出
+    """
+    # 创建数据库表
+    models.Base.metadata.create_all(bind=engine)
+
+    if once:
+        result = sync_scheduler.run_once('cli')
+        if result is None:
+            print("⏳ 其他实例正在同步, 本次跳过")
+        else:
+            print(f"🎉 同步{'完成' if result['status'] == 'success' else '失败'}: {result}")
+        return
+
+    print(f"🚀 片库同步守护进程启动, 间隔 {sync_scheduler.interval:.0f}s")
+    sync_scheduler.initial_delay = 0
+    asyncio.run(sync_scheduler.run_forever('cli'))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    # python sync_daemon.py        按间隔持续同步
+    # python sync_daemon.py once   同步一次后退出
+    sync_daemon(once=len(sys.argv) > 1 and sys.argv[1] == 'once')
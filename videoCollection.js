@@ -9,6 +9,15 @@ export const isCollectVideo = (params) => {
   })
 }
 
+// 批量检查收藏状态 (卡片列表使用)
+export const isCollectVideos = (vodIds) => {
+  return service({
+    url: '/collection/is_collection/batch',
+    method: 'post',
+    data: { vod_ids: vodIds }
+  })
+}
+
 // 添加收藏
 export const addCollectVideo = (data) => {
   return service({
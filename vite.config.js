@@ -74,6 +74,7 @@ export default defineConfig({
         target: 'http://127.0.0.1:8000',
         changeOrigin: true,
         secure: false,
+        ws: true,
         rewrite: (path) => path.replace(/^\/api\/live/, '/live')
       },
       '/api/proxy/m3u8': {
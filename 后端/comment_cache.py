@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+# 影片评论缓存
+# 按 vod_id 缓存组装好的评论树 (全部主评论及内联回复), 附带内容摘要作为 ETag;
+# 发表 / 回复 / 删除评论及管理员的评论操作提交后立即失效对应影片的缓存.
+# 默认使用进程内 LRU, 配置 COMMENT_CACHE_REDIS_URL 后改用 Redis 在多个 worker 间共享.
+# 每个影片有一个失效代数, 与缓存存放在同一后端: 读库前记下代数, 回填时代数已变 (期间有写入) 则不保存
+
+COMMENT_CACHE_TTL = int(os.getenv("COMMENT_CACHE_TTL", "300"))
+COMMENT_CACHE_SIZE = int(os.getenv("COMMENT_CACHE_SIZE", "2048"))
+COMMENT_CACHE_REDIS_URL = os.getenv("COMMENT_CACHE_REDIS_URL")
+# Redis 中失效代数的保留时间, 远大于一次读库的耗时即可
+GENERATION_TTL = 24 * 3600
+
+
+class MemoryBackend:
+    """进程内 LRU 存储"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # 失效代数取自全局递增计数, 同样按 LRU 限制条数;
+        # 被淘汰的代数并入 _floor, 没有记录的影片返回 _floor, 保证淘汰后代数不会回退
+        self._generations: "OrderedDict[str, int]" = OrderedDict()
+        self._counter = 0
+        self._floor = 0
+
+    async def get(self, key: str) -> Optional[dict]:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def generation(self, key: str) -> int:
+        return self._generations.get(key, self._floor)
+
+    async def set(self, key: str, value: dict, ttl: int, generation: int) -> bool:
+        if self._generations.get(key, self._floor) != generation:
+            return False
+        self._entries[key] = (time.time() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return True
+
+    async def invalidate(self, key: str) -> None:
+        self._counter += 1
+        self._generations[key] = self._counter
+        self._generations.move_to_end(key)
+        while len(self._generations) > self.max_entries:
+            _, generation = self._generations.popitem(last=False)
+            self._floor = max(self._floor, generation)
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Redis 共享存储 (redis.asyncio, 不阻塞事件循环), 值以 JSON 保存"""
+
+    # 代数未变时才写入, 比较与写入在 Redis 内原子执行
+    SET_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('SETEX', KEYS[1], ARGV[2], ARGV[3])
+return 1
+"""
+
+    def __init__(self, url: str, prefix: str = "sakura:comments:"):
+        import redis.asyncio  # 可选依赖, 仅在配置 COMMENT_CACHE_REDIS_URL 时需要
+        self.prefix = prefix
+        self._client = redis.asyncio.Redis.from_url(url)
+
+    def _generation_key(self, key: str) -> str:
+        return f"{self.prefix}gen:{key}"
+
+    async def get(self, key: str) -> Optional[dict]:
+        raw = await self._client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    async def generation(self, key: str) -> int:
+        raw = await self._client.get(self._generation_key(key))
+        return int(raw) if raw is not None else 0
+
+    async def set(self, key: str, value: dict, ttl: int, generation: int) -> bool:
+        stored = await self._client.eval(
+            self.SET_SCRIPT, 2, self.prefix + key, self._generation_key(key),
+            generation, ttl, json.dumps(value, ensure_ascii=False)
+        )
+        return stored == 1
+
+    async def invalidate(self, key: str) -> None:
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.incr(self._generation_key(key))
+            pipe.expire(self._generation_key(key), GENERATION_TTL)
+            pipe.delete(self.prefix + key)
+            await pipe.execute()
+
+
+class CommentThreadCache:
+    def __init__(self, backend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+        self.counters = {'hits': 0, 'misses': 0, 'invalidations': 0, 'stale': 0, 'errors': 0}
+
+    def set_backend(self, backend) -> None:
+        """替换存储后端 (需提供 get / generation / set / invalidate 协程)"""
+        self.backend = backend
+
+    @staticmethod
+    def _key(vod_id: int) -> str:
+        return str(vod_id)
+
+    async def generation(self, vod_id: int) -> Optional[int]:
+        """读库前调用, 结果传给 put; 后端不可用时返回 None, 本次结果不回填"""
+        try:
+            return await self.backend.generation(self._key(vod_id))
+        except Exception as e:
+            self.counters['errors'] += 1
+            print(f"⚠️ 评论缓存读取失败: {e}")
+            return None
+
+    async def get(self, vod_id: int) -> Optional[dict]:
+        """返回 {'etag', 'threads'}, 未命中时返回 None"""
+        try:
+            entry = await self.backend.get(self._key(vod_id))
+        except Exception as e:
+            self.counters['errors'] += 1
+            print(f"⚠️ 评论缓存读取失败: {e}")
+            entry = None
+        self.counters['hits' if entry is not None else 'misses'] += 1
+        return entry
+
+    async def put(self, vod_id: int, threads: List[dict], generation: Optional[int]) -> dict:
+        """保存评论树并返回缓存项; 读取期间缓存已被失效时只返回不保存"""
+        digest = hashlib.sha1(
+            json.dumps(threads, ensure_ascii=False, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()[:20]
+        entry = {'etag': digest, 'threads': threads}
+        if generation is None:
+            return entry
+        try:
+            if not await self.backend.set(self._key(vod_id), entry, self.ttl, generation):
+                self.counters['stale'] += 1
+        except Exception as e:
+            self.counters['errors'] += 1
+            print(f"⚠️ 评论缓存写入失败: {e}")
+        return entry
+
+    async def invalidate(self, vod_id: Optional[int]) -> None:
+        """影片评论发生变化后调用 (在事务提交之后)"""
+        if vod_id is None:
+            return
+        self.counters['invalidations'] += 1
+        try:
+            await self.backend.invalidate(self._key(vod_id))
+        except Exception as e:
+            self.counters['errors'] += 1
+            print(f"⚠️ 评论缓存失效失败: {e}")
+
+    def stats(self) -> dict:
+        stats = dict(self.counters)
+        if isinstance(self.backend, MemoryBackend):
+            stats['entries'] = len(self.backend)
+        return stats
+
+
+def _default_backend():
+    if COMMENT_CACHE_REDIS_URL:
+        return RedisBackend(COMMENT_CACHE_REDIS_URL)
+    return MemoryBackend(COMMENT_CACHE_SIZE)
+
+
+comment_cache = CommentThreadCache(_default_backend(), COMMENT_CACHE_TTL)
@@ -1,7 +1,10 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 import os
+import time
 
 # MySQL 数据库配置
 MYSQL_USER = os.getenv("MYSQL_USER", "root")
@@ -12,17 +15,188 @@ MYSQL_DATABASE = os.getenv("MYSQL_DATABASE", "movie")
 
 # MySQL 数据库 URL
 SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}"
+# 异步驱动 URL (aiomysql), 供高频只读接口使用
+ASYNC_SQLALCHEMY_DATABASE_URL = f"mysql+aiomysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}"
+
+# 连接池配置 - 按 worker 数量调整, 每个 worker 进程各自持有一套连接池
+# 同步池服务线程池中的请求, 异步池服务事件循环中的请求, 未单独配置时使用相同的大小
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+ASYNC_POOL_SIZE = int(os.getenv("DB_ASYNC_POOL_SIZE", str(POOL_SIZE)))
+ASYNC_MAX_OVERFLOW = int(os.getenv("DB_ASYNC_MAX_OVERFLOW", str(MAX_OVERFLOW)))
+# 等待空闲连接的最长秒数, 超时抛出 sqlalchemy.exc.TimeoutError
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+# 取出连接前的存活检测: always=每次检测 (多一次往返), idle=仅空闲超过 POOL_PING_IDLE 秒时检测, never=不检测
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "idle").lower()
+POOL_PING_IDLE = float(os.getenv("DB_POOL_PING_IDLE", "30"))
+
+# 等待连接耗时直方图的桶上限 (毫秒)
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class PoolMetrics:
+    """连接池统计: 等待耗时分布、超时次数、连接建立/失效次数及当前占用情况"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool = None
+        self.wait_histogram = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.counters = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'connects': 0,
+            'invalidations': 0,
+            'pings': 0,
+            'ping_failures': 0,
+            'max_checked_out': 0,
+            'wait_ms_total': 0.0,
+            'wait_ms_max': 0.0,
+        }
+
+    def observe_wait(self, seconds: float, checked_out: int) -> None:
+        wait_ms = seconds * 1000
+        index = 0
+        while index < len(WAIT_BUCKETS_MS) and wait_ms > WAIT_BUCKETS_MS[index]:
+            index += 1
+        self.wait_histogram[index] += 1
+        self.counters['checkouts'] += 1
+        self.counters['wait_ms_total'] += wait_ms
+        self.counters['wait_ms_max'] = max(self.counters['wait_ms_max'], wait_ms)
+        self.counters['max_checked_out'] = max(self.counters['max_checked_out'], checked_out)
+
+    def stats(self) -> dict:
+        checkouts = self.counters['checkouts']
+        stats = {
+            **self.counters,
+            'avg_wait_ms': round(self.counters['wait_ms_total'] / checkouts, 2) if checkouts else 0.0,
+            'wait_histogram_ms': {
+                **{f"le_{bound}": count for bound, count in zip(WAIT_BUCKETS_MS, self.wait_histogram)},
+                'gt_max': self.wait_histogram[-1],
+            },
+        }
+        if self.pool is not None:
+            stats.update({
+                'pool_size': self.pool.size(),
+                'checked_out': self.pool.checkedout(),
+                'idle': self.pool.checkedin(),
+                'overflow': self.pool.overflow(),
+            })
+        return stats
+
+
+def _instrumented_pool(base, metrics: PoolMetrics):
+    """生成记录取连接耗时的连接池类 (dispose 重建连接池时沿用同一个类)"""
+
+    class InstrumentedPool(base):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            metrics.pool = self
+
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except exc.TimeoutError:
+                metrics.counters['timeouts'] += 1
+                raise
+            metrics.observe_wait(time.perf_counter() - started, self.checkedout())
+            return connection
+
+    InstrumentedPool.__name__ = f"Instrumented{base.__name__}"
+    return InstrumentedPool
+
+
+def _install_pool_events(sync_engine, metrics: PoolMetrics) -> None:
+    @event.listens_for(sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        metrics.counters['connects'] += 1
+
+    @event.listens_for(sync_engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.counters['invalidations'] += 1
+
+    if POOL_PRE_PING != "idle":
+        return
+
+    @event.listens_for(sync_engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        connection_record.info['last_used'] = time.monotonic()
+
+    @event.listens_for(sync_engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        last_used = connection_record.info.get('last_used')
+        # 新建连接或刚用过的连接跳过检测
+        if last_used is None or time.monotonic() - last_used < POOL_PING_IDLE:
+            return
+        metrics.counters['pings'] += 1
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("SELECT 1")
+        except Exception as e:
+            metrics.counters['ping_failures'] += 1
+            # 抛出 DisconnectionError 后连接池丢弃该连接并重新获取
+            raise exc.DisconnectionError(f"连接已失效: {e}")
+        finally:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+
+
+sync_pool_metrics = PoolMetrics("sync")
+async_pool_metrics = PoolMetrics("async")
 
 # 创建数据库引擎
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
-    pool_pre_ping=True,
-    pool_recycle=3600,
+    poolclass=_instrumented_pool(QueuePool, sync_pool_metrics),
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
+    pool_timeout=POOL_TIMEOUT,
+    pool_pre_ping=POOL_PRE_PING == "always",
+    pool_recycle=POOL_RECYCLE,
+)
+_install_pool_events(engine, sync_pool_metrics)
+
+# 创建异步引擎 - 查询在事件循环中等待, 不占用线程池
+async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL,
+    poolclass=_instrumented_pool(AsyncAdaptedQueuePool, async_pool_metrics),
+    pool_size=ASYNC_POOL_SIZE,
+    max_overflow=ASYNC_MAX_OVERFLOW,
+    pool_timeout=POOL_TIMEOUT,
+    pool_pre_ping=POOL_PRE_PING == "always",
+    pool_recycle=POOL_RECYCLE,
 )
+_install_pool_events(async_engine.sync_engine, async_pool_metrics)
+
+
+def pool_stats() -> dict:
+    """同步 / 异步连接池的当前状态与累计统计"""
+    return {
+        'config': {
+            'pool_size': POOL_SIZE,
+            'max_overflow': MAX_OVERFLOW,
+            'async_pool_size': ASYNC_POOL_SIZE,
+            'async_max_overflow': ASYNC_MAX_OVERFLOW,
+            'pool_timeout': POOL_TIMEOUT,
+            'pool_recycle': POOL_RECYCLE,
+            'pre_ping': POOL_PRE_PING,
+            'ping_idle': POOL_PING_IDLE,
+        },
+        'sync': sync_pool_metrics.stats(),
+        'async': async_pool_metrics.stats(),
+    }
 
 # 创建 SessionLocal 类
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 创建 AsyncSessionLocal 类 (提交后不过期对象, 避免在异步上下文中隐式加载)
+AsyncSessionLocal = sessionmaker(
+    async_engine, class_=AsyncSession, expire_on_commit=False, autoflush=False
+)
+
 # 创建 Base 类
 Base = declarative_base()
 
@@ -32,4 +206,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# 依赖注入获取异步数据库会话
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
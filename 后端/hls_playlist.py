@@ -0,0 +1,130 @@
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import quote, unquote, urljoin
+
+from app import hls_proxy
+from app.cdn_health import cdn_health
+
+# M3U8 播放列表改写与缓存
+# 单次遍历完成改写: 分片/密钥/初始化段走 /vod/proxy/file, 子播放列表走 /vod/proxy/m3u8;
+# 改写结果按上游 URL 缓存在内存, 过期后携带 ETag / Last-Modified 条件请求重新验证
+
+FILE_PROXY_PREFIX = "/vod/proxy/file?url="
+PLAYLIST_PROXY_PREFIX = "/vod/proxy/m3u8?url="
+
+# 点播列表(含 #EXT-X-ENDLIST)内容不再变化, 直播列表需要频繁刷新
+VOD_PLAYLIST_TTL = int(os.getenv("HLS_PLAYLIST_VOD_TTL", "3600"))
+LIVE_PLAYLIST_TTL = int(os.getenv("HLS_PLAYLIST_LIVE_TTL", "2"))
+MAX_CACHED_PLAYLISTS = int(os.getenv("HLS_PLAYLIST_CACHE_SIZE", "1024"))
+
+URI_ATTRIBUTE_PATTERN = re.compile(r'URI="([^"]*)"')
+
+
+class RewrittenPlaylist(NamedTuple):
+    text: str
+    segments: List[str]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    expires_at: float
+
+
+def _is_playlist(url: str) -> bool:
+    return url.split('?', 1)[0].lower().endswith('.m3u8')
+
+
+def rewrite_playlist(content: str, base_url: str) -> Tuple[str, List[str]]:
+    """
+    改写播放列表中的所有 URI 使其经过代理
+    返回改写后的文本和按顺序排列的分片上游地址 (供预读使用)
+    """
+    segments = []
+    lines = []
+    expect_variant = False
+
+    def proxied(uri: str, variant: bool) -> str:
+        absolute = urljoin(base_url, uri.strip())
+        if variant or _is_playlist(absolute):
+            return PLAYLIST_PROXY_PREFIX + quote(absolute)
+        return FILE_PROXY_PREFIX + quote(absolute)
+
+    for line in content.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            lines.append(line)
+        elif stripped.startswith('#'):
+            if 'URI="' in stripped:
+                # #EXT-X-KEY / #EXT-X-MAP / #EXT-X-MEDIA / #EXT-X-I-FRAME-STREAM-INF
+                variant = stripped.startswith(('#EXT-X-MEDIA', '#EXT-X-I-FRAME-STREAM-INF'))
+                stripped = URI_ATTRIBUTE_PATTERN.sub(
+                    lambda m: 'URI="%s"' % proxied(m.group(1), variant), stripped
+                )
+            if stripped.startswith('#EXT-X-STREAM-INF'):
+                expect_variant = True
+            lines.append(stripped)
+        else:
+            if not expect_variant and not _is_playlist(stripped):
+                segments.append(unquote(urljoin(base_url, stripped)))
+            lines.append(proxied(stripped, expect_variant))
+            expect_variant = False
+
+    return '\n'.join(lines), segments
+
+
+class PlaylistCache:
+    def __init__(self, max_entries: int, vod_ttl: int, live_ttl: int):
+        self.max_entries = max_entries
+        self.vod_ttl = vod_ttl
+        self.live_ttl = live_ttl
+        self._entries: "OrderedDict[str, RewrittenPlaylist]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.counters = {'hits': 0, 'revalidated': 0, 'refreshed': 0, 'misses': 0}
+
+    def _ttl_for(self, text: str) -> int:
+        return self.vod_ttl if '#EXT-X-ENDLIST' in text else self.live_ttl
+
+    async def get(self, url: str) -> RewrittenPlaylist:
+        """获取改写后的播放列表, 新鲜时直接返回内存结果"""
+        entry = self._entries.get(url)
+        if entry is not None and entry.expires_at > time.time():
+            self._entries.move_to_end(url)
+            self.counters['hits'] += 1
+            return entry
+
+        future = self._inflight.get(url)
+        if future is None:
+            future = asyncio.ensure_future(self._load(url, entry))
+            self._inflight[url] = future
+            future.add_done_callback(lambda _: self._inflight.pop(url, None))
+        return await asyncio.shield(future)
+
+    async def _load(self, url: str, stale: Optional[RewrittenPlaylist]) -> RewrittenPlaylist:
+        # 从最快的镜像获取, 改写时仍以原地址为基准, 分片请求时再各自选择镜像
+        status, text, etag, last_modified = await hls_proxy.fetch_playlist(
+            cdn_health.pick(url),
+            etag=stale.etag if stale else None,
+            last_modified=stale.last_modified if stale else None,
+        )
+        if status == 304 and stale is not None:
+            entry = stale._replace(expires_at=time.time() + self._ttl_for(stale.text))
+            self.counters['revalidated'] += 1
+        else:
+            fixed_text, segments = rewrite_playlist(text, url)
+            entry = RewrittenPlaylist(fixed_text, segments, etag, last_modified,
+                                      time.time() + self._ttl_for(text))
+            self.counters['refreshed' if stale else 'misses'] += 1
+
+        self._entries[url] = entry
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def stats(self) -> dict:
+        return {**self.counters, 'entries': len(self._entries)}
+
+
+playlist_cache = PlaylistCache(MAX_CACHED_PLAYLISTS, VOD_PLAYLIST_TTL, LIVE_PLAYLIST_TTL)
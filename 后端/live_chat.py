@@ -0,0 +1,134 @@
+import asyncio
+from datetime import timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session, joinedload
+from starlette.concurrency import run_in_threadpool
+
+from app import models
+from app.database import SessionLocal
+
+# 直播聊天室广播中心
+# 每个直播间维护一组订阅队列, 发送评论时在进程内扇出给所有在线连接;
+# 断线重连的客户端携带最后收到的评论 ID, 只从数据库补齐缺失的部分.
+# 注意: 广播只在当前进程内生效, 多 worker 部署时需要粘性会话或外部消息总线
+
+# 首次进入直播间时返回的历史条数
+HISTORY_LIMIT = 50
+# 评论接口单页上限
+MAX_PAGE_SIZE = 200
+# 单次补齐的最大条数, 超出部分客户端可通过评论接口分页获取
+RESUME_LIMIT = 500
+# 单个连接积压的消息上限, 超过后断开该连接, 由客户端重连补齐
+SUBSCRIBER_QUEUE_SIZE = 256
+
+
+def serialize_comment(comment: models.LiveComment) -> dict:
+    """转换为前端使用的评论格式 (UTC 时间转北京时间)"""
+    display_time = "未知时间"
+    if comment.timestamp:
+        display_time = (comment.timestamp + timedelta(hours=8)).strftime('%H:%M')
+    return {
+        'id': comment.id,
+        'username': comment.user.name if comment.user else '匿名用户',
+        'avatar': '/api/imgs/avatar-default.jpg',
+        'content': comment.content,
+        'time': display_time,
+        'isOwn': False,
+        'isSystem': False
+    }
+
+
+def query_comments(db: Session, stream_id: int, after_id: Optional[int] = None,
+                   before_id: Optional[int] = None, limit: int = HISTORY_LIMIT) -> Tuple[List[models.LiveComment], bool]:
+    """
+    按评论 ID 游标查询直播评论, 结果按 ID 升序
+    after_id: 只取该 ID 之后的评论 (从旧到新取 limit 条)
+    否则取 before_id 之前 (未指定时为最新) 的 limit 条
+    返回 (评论列表, 是否还有更早的评论)
+    """
+    query = db.query(models.LiveComment).options(
+        joinedload(models.LiveComment.user)
+    ).filter(models.LiveComment.live_stream_id == stream_id)
+
+    if after_id is not None:
+        query = query.filter(models.LiveComment.id > after_id)
+        if before_id is not None:
+            query = query.filter(models.LiveComment.id < before_id)
+        comments = query.order_by(models.LiveComment.id.asc()).limit(limit).all()
+        return comments, False
+
+    if before_id is not None:
+        query = query.filter(models.LiveComment.id < before_id)
+    # 多取一条用于判断是否还有更早的评论
+    comments = query.order_by(models.LiveComment.id.desc()).limit(limit + 1).all()
+    has_older = len(comments) > limit
+    comments = comments[:limit]
+    comments.reverse()
+    return comments, has_older
+
+
+def _load_comments(stream_id: int, last_id: Optional[int]) -> List[dict]:
+    db = SessionLocal()
+    try:
+        if last_id is None:
+            # 首次进入: 最近的 N 条
+            comments, _ = query_comments(db, stream_id, limit=HISTORY_LIMIT)
+        else:
+            comments, _ = query_comments(db, stream_id, after_id=last_id, limit=RESUME_LIMIT)
+        return [serialize_comment(comment) for comment in comments]
+    finally:
+        db.close()
+
+
+async def load_comments(stream_id: int, last_id: Optional[int] = None) -> List[dict]:
+    """加载首屏历史或断线期间错过的评论 (在线程池中查询, 不阻塞事件循环)"""
+    return await run_in_threadpool(_load_comments, stream_id, last_id)
+
+
+class ChatHub:
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._rooms: Dict[int, Set[asyncio.Queue]] = {}
+        self.counters = {'published': 0, 'delivered': 0, 'dropped_subscribers': 0}
+
+    def subscribe(self, stream_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._rooms.setdefault(stream_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, stream_id: int, queue: asyncio.Queue) -> None:
+        subscribers = self._rooms.get(stream_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._rooms[stream_id]
+
+    def publish(self, stream_id: int, message: dict) -> None:
+        """向直播间的所有连接广播一条消息"""
+        self.counters['published'] += 1
+        for queue in list(self._rooms.get(stream_id, ())):
+            try:
+                queue.put_nowait(message)
+                self.counters['delivered'] += 1
+            except asyncio.QueueFull:
+                # 消费过慢: 清空队列并放入 None 通知连接关闭, 客户端重连后从数据库补齐
+                self.unsubscribe(stream_id, queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+                self.counters['dropped_subscribers'] += 1
+
+    def online_count(self, stream_id: int) -> int:
+        return len(self._rooms.get(stream_id, ()))
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            'rooms': len(self._rooms),
+            'connections': sum(len(subscribers) for subscribers in self._rooms.values()),
+        }
+
+
+chat_hub = ChatHub(SUBSCRIBER_QUEUE_SIZE)
@@ -0,0 +1,175 @@
+import asyncio
+import os
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import bindparam, case, func, update
+from starlette.concurrency import run_in_threadpool
+
+from app import models
+from app.database import SessionLocal
+
+# 直播计数器
+# 观看数 / 点赞数在进程内累加, 在线观众按心跳维护并定时过期,
+# 后台按固定间隔把增量批量写回 sakura_live_stream (同时维护 max_viewers 峰值),
+# 热门直播间不再每次请求都对同一行加锁写库
+
+FLUSH_INTERVAL = float(os.getenv("LIVE_COUNTER_FLUSH_INTERVAL", "5"))
+# 超过该时间未收到心跳的观众视为离开
+PRESENCE_TTL = float(os.getenv("LIVE_PRESENCE_TTL", "30"))
+
+
+class LiveCounters:
+    def __init__(self, flush_interval: float, presence_ttl: float):
+        self.flush_interval = flush_interval
+        self.presence_ttl = presence_ttl
+        # 待写回的增量: 直播ID -> 数量
+        self._views: Dict[int, int] = {}
+        self._likes: Dict[int, int] = {}
+        # 上次写回以来的在线峰值
+        self._peaks: Dict[int, int] = {}
+        # 在线观众: 直播ID -> {观众标识: 最后心跳时间}
+        self._presence: Dict[int, Dict[str, float]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {'flushes': 0, 'flushed_rows': 0, 'flush_errors': 0}
+
+    # ---------- 计数 ----------
+
+    def heartbeat(self, stream_id: int, viewer_id: Optional[str] = None) -> None:
+        """
+        记录一次观看
+        携带观众标识时按心跳维护在线状态, 只有新进入的观众计入观看数;
+        不带标识的请求每次都计为一次观看
+        """
+        if not viewer_id:
+            self._views[stream_id] = self._views.get(stream_id, 0) + 1
+            return
+        viewers = self._presence.setdefault(stream_id, {})
+        if viewer_id not in viewers:
+            self._views[stream_id] = self._views.get(stream_id, 0) + 1
+        viewers[viewer_id] = time.monotonic()
+        if len(viewers) > self._peaks.get(stream_id, 0):
+            self._peaks[stream_id] = len(viewers)
+
+    def leave(self, stream_id: int, viewer_id: str) -> None:
+        viewers = self._presence.get(stream_id)
+        if viewers is not None:
+            viewers.pop(viewer_id, None)
+
+    def like(self, stream_id: int, count: int = 1) -> None:
+        self._likes[stream_id] = self._likes.get(stream_id, 0) + count
+
+    # ---------- 读取 (数据库值 + 未写回的增量) ----------
+
+    def viewer_count(self, stream: models.LiveStream) -> int:
+        return (stream.viewer_count or 0) + self._views.get(stream.id, 0)
+
+    def likes(self, stream: models.LiveStream) -> int:
+        return (stream.likes or 0) + self._likes.get(stream.id, 0)
+
+    def online_count(self, stream_id: int) -> int:
+        return len(self._presence.get(stream_id, ()))
+
+    def max_viewers(self, stream: models.LiveStream) -> int:
+        return max(stream.max_viewers or 0, self._peaks.get(stream.id, 0))
+
+    # ---------- 写回 ----------
+
+    def _expire(self) -> None:
+        deadline = time.monotonic() - self.presence_ttl
+        for stream_id in list(self._presence):
+            viewers = self._presence[stream_id]
+            for viewer_id in [v for v, seen in viewers.items() if seen < deadline]:
+                del viewers[viewer_id]
+            if not viewers:
+                del self._presence[stream_id]
+
+    @staticmethod
+    def _write(rows: list) -> None:
+        stream = models.LiveStream.__table__
+        current_max = func.coalesce(stream.c.max_viewers, 0)
+        statement = update(stream).where(stream.c.id == bindparam('stream_id')).values(
+            viewer_count=func.coalesce(stream.c.viewer_count, 0) + bindparam('views'),
+            likes=func.coalesce(stream.c.likes, 0) + bindparam('likes'),
+            max_viewers=case((current_max < bindparam('peak'), bindparam('peak')), else_=current_max),
+        )
+        db = SessionLocal()
+        try:
+            # executemany: 一个事务内批量更新所有有变化的直播
+            db.execute(statement, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def flush(self) -> None:
+        """把累计的增量写回数据库, 失败时增量放回下次重试"""
+        self._expire()
+        views, self._views = self._views, {}
+        likes, self._likes = self._likes, {}
+        peaks, self._peaks = self._peaks, {}
+        stream_ids = set(views) | set(likes) | set(peaks)
+        if not stream_ids:
+            return
+        rows = [
+            {
+                'stream_id': stream_id,
+                'views': views.get(stream_id, 0),
+                'likes': likes.get(stream_id, 0),
+                'peak': peaks.get(stream_id, 0),
+            }
+            for stream_id in stream_ids
+        ]
+        try:
+            await run_in_threadpool(self._write, rows)
+        except Exception:
+            self.counters['flush_errors'] += 1
+            for stream_id, count in views.items():
+                self._views[stream_id] = self._views.get(stream_id, 0) + count
+            for stream_id, count in likes.items():
+                self._likes[stream_id] = self._likes.get(stream_id, 0) + count
+            for stream_id, peak in peaks.items():
+                self._peaks[stream_id] = max(self._peaks.get(stream_id, 0), peak)
+            raise
+        self.counters['flushes'] += 1
+        self.counters['flushed_rows'] += len(rows)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"⚠️ 直播计数写回失败: {e}")
+
+    def start(self) -> None:
+        """启动后台写回任务, 在应用启动时调用"""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """停止后台任务并写回剩余增量"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"⚠️ 直播计数写回失败: {e}")
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            'pending_streams': len(set(self._views) | set(self._likes) | set(self._peaks)),
+            'online_streams': len(self._presence),
+            'online_viewers': sum(len(viewers) for viewers in self._presence.values()),
+        }
+
+
+live_counters = LiveCounters(FLUSH_INTERVAL, PRESENCE_TTL)
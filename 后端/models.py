@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean  # 添加 Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean, Index, JSON  # 添加 Boolean
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -47,6 +47,7 @@ class MovDetail(Base):
     __tablename__ = "sakura_movdetail"  # 使用原电影详情表
     
     id = Column(Integer, primary_key=True, index=True)
+    vod_id = Column(Integer, index=True)  # 上游接口的视频ID, 对应 sakura_movinfo.vod_id
     vod_name = Column(String(200))
     vod_pic = Column(String(500))
     vod_remarks = Column(String(100))
@@ -55,9 +56,18 @@ class MovDetail(Base):
     vod_content = Column(Text)
     vod_play_url = Column(Text)
     vod_time = Column(DateTime)
+    vod_play_list = Column(JSON, nullable=True)  # 入库时预解析的剧集列表 [{"name", "url"}]
+    vod_content_clean = Column(Text, nullable=True)  # 入库时去除标签后的简介
+    content_hash = Column(String(40), nullable=True)  # 上游原始记录的摘要, 同步时内容未变则跳过
     
     comments = relationship("Comment", back_populates="movdetail")
 
+    # 游标分页使用的复合索引: ORDER BY vod_time DESC, id DESC
+    __table_args__ = (
+        Index("ix_movdetail_vod_time_id", "vod_time", "id"),
+        Index("ix_movdetail_type_vod_time_id", "type_id", "vod_time", "id"),
+    )
+
 class MovInfo(Base):
     __tablename__ = "sakura_movinfo"  # 使用原电影信息表
     
@@ -71,21 +81,81 @@ class MovInfo(Base):
     vod_play_from = Column(String(100))
     vod_play_url = Column(Text)
 
+class SearchTerm(Base):
+    __tablename__ = "sakura_search_term"  # 片库搜索倒排表: 词项 -> 影片
+
+    id = Column(Integer, primary_key=True, index=True)
+    term = Column(String(32), nullable=False)
+    movdetail_id = Column(Integer, ForeignKey("sakura_movdetail.id", ondelete="CASCADE"), nullable=False, index=True)
+    weight = Column(Integer, default=1)
+
+    __table_args__ = (
+        Index("ix_search_term_term_movdetail", "term", "movdetail_id", unique=True),
+    )
+
 class MovType(Base):
     __tablename__ = "sakura_movtype"  # 使用原分类表
     
     type_id = Column(Integer, primary_key=True, index=True)
     type_name = Column(String(50))
 
+# 爬虫断点表: 每个已入库的分页一行, 中断后重新运行时跳过这些页
+class CrawlCheckpoint(Base):
+    __tablename__ = "sakura_crawl_checkpoint"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job = Column(String(32), nullable=False)  # mov_info / mov_detail
+    page = Column(Integer, nullable=False)
+    items = Column(Integer, default=0)
+    finished_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_crawl_checkpoint_job_page", "job", "page", unique=True),
+    )
+
+# 片库增量同步的运行记录
+class CatalogSyncRun(Base):
+    __tablename__ = "sakura_sync_run"
+
+    id = Column(Integer, primary_key=True, index=True)
+    trigger = Column(String(16), nullable=False)  # schedule / manual / cli
+    status = Column(String(16), nullable=False)  # running / success / failed / aborted
+    runner = Column(String(100))  # 主机名:进程号
+    started_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False, index=True)
+    finished_at = Column(DateTime, nullable=True)
+    duration_ms = Column(Integer, nullable=True)
+    pages = Column(Integer, default=0)
+    inserted = Column(Integer, default=0)
+    updated = Column(Integer, default=0)
+    unchanged = Column(Integer, default=0)
+    skipped = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+
 class UserCollection(Base):
     __tablename__ = "sakura_user_collection"  # 使用原收藏表
     
+    # ⚠️ 旧格式 ("12;34;56;"), 仅供 migrate_collections.py 迁移使用, 新代码使用 UserCollectionItem
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("sakura_user.id"))  # 外键指向 sakura_user
     movdetail_id_list = Column(Text, default="")
     
     user = relationship("User", back_populates="collections")
 
+# 收藏明细表: 每个收藏一行
+class UserCollectionItem(Base):
+    __tablename__ = "sakura_user_collection_item"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("sakura_user.id", ondelete="CASCADE"), nullable=False)
+    movdetail_id = Column(Integer, ForeignKey("sakura_movdetail.id", ondelete="CASCADE"), nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+    
+    # 是否收藏为唯一索引上的点查; 收藏列表按 (created_at DESC, id DESC) 游标分页
+    __table_args__ = (
+        Index("ix_collection_item_user_movdetail", "user_id", "movdetail_id", unique=True),
+        Index("ix_collection_item_user_created_id", "user_id", "created_at", "id"),
+    )
+
 class Comment(Base):
     __tablename__ = "sakura_comment"
     
@@ -116,6 +186,7 @@ class LiveStream(Base):
     status = Column(Integer, default=1)
     viewer_count = Column(Integer, default=0)
     max_viewers = Column(Integer, default=0)
+    likes = Column(Integer, default=0)
     start_time = Column(DateTime)
     created_time = Column(DateTime, default=datetime.datetime.utcnow)
     end_time = Column(DateTime, nullable=True)
@@ -137,6 +208,11 @@ class LiveComment(Base):
     stream = relationship("LiveStream", back_populates="comments")
     user = relationship("User", back_populates="live_comments")
 
+    # 按直播间的 ID 游标分页: WHERE live_stream_id = ? AND id > / < ? ORDER BY id
+    __table_args__ = (
+        Index("ix_live_comment_stream_id", "live_stream_id", "id"),
+    )
+
 # 基础视频表（如果需要保留）
 class Video(Base):
     __tablename__ = "videos"  # 这个可以保留为新表
@@ -0,0 +1,36 @@
+import re
+from typing import Dict, List, Optional
+
+# 播放地址/简介的入库预处理
+# 上游 vod_play_url 形如 "第01集$https://.../index.m3u8#第02集$https://...",
+# 入库时一次性拆分成剧集列表, 详情接口直接读取结果;
+# CDN 镜像的选择由 cdn_health 在读取时根据探测结果完成
+
+CONTENT_TAG_PATTERN = re.compile(r'</?(?:p|span)(?:\s[^>]*)?>', re.IGNORECASE)
+
+
+def parse_play_url(vod_play_url: Optional[str]) -> List[Dict[str, str]]:
+    """拆分 vod_play_url 为有序的剧集列表 [{"name": ..., "url": ...}]"""
+    episodes = []
+    if not vod_play_url:
+        return episodes
+    for play_url_set in vod_play_url.split('#'):
+        if '$' not in play_url_set:
+            continue
+        name, url = play_url_set.split('$', 1)
+        episodes.append({'name': name, 'url': url.strip()})
+    return episodes
+
+
+def sanitize_content(vod_content: Optional[str]) -> str:
+    """去掉简介中的 <p>/<span> 标签"""
+    if not vod_content:
+        return ''
+    return CONTENT_TAG_PATTERN.sub('', vod_content)
+
+
+def prepare_movdetail(mov_detail: dict) -> dict:
+    """为待入库的 movdetail 字典补充预处理字段, 供爬虫和后台录入使用"""
+    mov_detail['vod_play_list'] = parse_play_url(mov_detail.get('vod_play_url'))
+    mov_detail['vod_content_clean'] = sanitize_content(mov_detail.get('vod_content'))
+    return mov_detail
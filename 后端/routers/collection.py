@@ -1,9 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from app.database import get_db
 from app import models, schemas
 from app.security import get_current_user 
+from app.pagination import encode_cursor, decode_cursor
+from app.favorite_cache import favorite_cache, MAX_BATCH_SIZE
 
 router = APIRouter(prefix="/collection", tags=["video-collection"])
 
@@ -11,15 +15,14 @@ router = APIRouter(prefix="/collection", tags=["video-collection"])
 async def show_collect_video(
     page: int = Query(1, ge=1, description="页码"),
     per_page: int = Query(12, ge=1, le=100, description="每页数量"),
+    cursor: Optional[str] = Query(None, description="游标, 传入上一页返回的 next_cursor; 传入后忽略 page"),
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     返回该用户的所有收藏视频 - 对应原Flask的 show_collect_video
+    按收藏时间倒序, 支持 page 偏移分页和 cursor 游标分页
     """
-    print(f"=== 认证调试 ===")
-    print(f"当前用户ID: {current_user.id}")
-    
     user_id = current_user.id
     
     if not user_id:
@@ -28,65 +31,54 @@ async def show_collect_video(
             detail="用户未登录或用户ID无效"
         )
     
-    # 查询用户收藏
-    user_collection = db.query(models.UserCollection).filter(
-        models.UserCollection.user_id == user_id
-    ).first()
+    item = models.UserCollectionItem
+    query = db.query(
+        item.id.label('item_id'),
+        item.created_at,
+        models.MovDetail.id,
+        models.MovDetail.vod_pic,
+        models.MovDetail.vod_name,
+        models.MovDetail.vod_remarks,
+        models.MovDetail.type_name
+    ).join(
+        models.MovDetail, models.MovDetail.id == item.movdetail_id
+    ).filter(
+        item.user_id == user_id
+    ).order_by(item.created_at.desc(), item.id.desc())
+    
+    cursor_values = decode_cursor(cursor, 2)
+    if cursor_values:
+        last_time, last_id = cursor_values
+        query = query.filter(or_(
+            item.created_at < last_time,
+            and_(item.created_at == last_time, item.id < last_id)
+        ))
+    else:
+        query = query.offset((page - 1) * per_page)
+    
+    # 多取一条判断是否还有下一页
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    
+    collect_vod_list = [
+        {
+            'vod_id': row.id,
+            'vod_pic': row.vod_pic,
+            'vod_name': row.vod_name, 
+            'vod_remarks': row.vod_remarks,
+            'type_name': row.type_name
+        }
+        for row in rows
+    ]
+    
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].item_id)
+    
+    total = db.query(item.id).filter(item.user_id == user_id).count()
     
-    collect_vod_list = []
-    has_more = False
-    
-    if user_collection and user_collection.movdetail_id_list:
-        # 解析电影ID列表
-        store_vod_list = user_collection.movdetail_id_list.strip(';').split(';')
-        store_vod_list = [id_str for id_str in store_vod_list if id_str]
-        
-        print(f"用户 {user_id} 的收藏电影ID列表: {store_vod_list}")
-        print(f"收藏电影数量: {len(store_vod_list)}")
-        
-        if store_vod_list:
-            try:
-                # 将字符串ID转换为整数
-                vod_ids = [int(vod_id) for vod_id in store_vod_list if vod_id.isdigit()]
-                print(f"转换后的整数ID列表: {vod_ids}")
-                
-                # 分页计算
-                start_index = (page - 1) * per_page
-                end_index = start_index + per_page
-                page_vod_ids = vod_ids[start_index:end_index]
-                
-                print(f"当前页ID范围: {start_index} - {end_index}")
-                print(f"当前页查询的ID: {page_vod_ids}")
-                
-                if page_vod_ids:
-                    # 查询电影详情
-                    collect_movs = db.query(models.MovDetail).filter(
-                        models.MovDetail.id.in_(page_vod_ids)
-                    ).order_by(models.MovDetail.vod_time.desc()).all()
-                    
-                    print(f"查询到的电影数量: {len(collect_movs)}")
-                    
-                    for mov in collect_movs:
-                        collect_vod_list.append({
-                            'vod_id': mov.id,
-                            'vod_pic': mov.vod_pic,
-                            'vod_name': mov.vod_name, 
-                            'vod_remarks': mov.vod_remarks,
-                            'type_name': mov.type_name
-                        })
-                
-                # 计算总页数
-                total_pages = (len(vod_ids) + per_page - 1) // per_page
-                has_more = page < total_pages
-                
-            except Exception as e:
-                print(f"查询收藏视频时出错: {e}")
-                raise HTTPException(
-                    status_code=500,
-                    detail="查询收藏列表失败"
-                )
-    
-    print(f"返回的收藏视频数量: {len(collect_vod_list)}")
+    print(f"用户 {user_id} 返回的收藏视频数量: {len(collect_vod_list)}")
     
     return {
         'code': 200,
@@ -96,8 +88,9 @@ async def show_collect_video(
             'pagination': {
                 'current_page': page,
                 'per_page': per_page,
-                'total': len(store_vod_list) if user_collection else 0,
-                'has_more': has_more
+                'total': total,
+                'has_more': has_more,
+                'next_cursor': next_cursor
             }
         }
     }
@@ -110,19 +103,19 @@ async def show_is_collect_video(
 ):
     """
     返回该视频是否被收藏 - 对应原Flask的 show_is_collect_video
+    单个影片直接走 (user_id, movdetail_id) 唯一索引查询, 不使用进程内缓存, 收藏后各 worker 立即一致
     """
-    user_collection = db.query(models.UserCollection).filter(
-        models.UserCollection.user_id == current_user.id
-    ).first()
+    collected = db.query(models.UserCollectionItem.id).filter(
+        models.UserCollectionItem.user_id == current_user.id,
+        models.UserCollectionItem.movdetail_id == vod_id
+    ).first() is not None
     
-    if user_collection:
-        vod_id_str = str(vod_id)
-        if vod_id_str in user_collection.movdetail_id_list:
-            return {
-                'code': 200,
-                'message': '该视频已被收藏',
-                'data': 1
-            }
+    if collected:
+        return {
+            'code': 200,
+            'message': '该视频已被收藏',
+            'data': 1
+        }
     
     return {
         'code': 200,
@@ -130,6 +123,32 @@ async def show_is_collect_video(
         'data': 0
     }
 
+@router.post("/is_collection/batch", response_model=schemas.IsCollectionBatchResponse)
+async def show_is_collect_videos(
+    query_data: schemas.IsCollectionBatchRequest,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    批量返回多个视频是否被收藏 - 卡片列表一次请求获取整页的收藏状态
+    """
+    if len(query_data.vod_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单次最多查询 {MAX_BATCH_SIZE} 个视频"
+        )
+    
+    collected_set = favorite_cache.get(db, current_user.id)
+    
+    return {
+        'code': 200,
+        'message': 'success',
+        'data': {
+            'collected': [vod_id for vod_id in query_data.vod_ids if vod_id in collected_set],
+            'bitmap': [1 if vod_id in collected_set else 0 for vod_id in query_data.vod_ids]
+        }
+    }
+
 @router.post("/add", response_model=schemas.BaseResponse)
 async def add_collect_video(
     collection_data: schemas.CollectionCreate,
@@ -142,52 +161,40 @@ async def add_collect_video(
     vod_id = collection_data.vod_id
     print(f"添加收藏: user_id={current_user.id}, vod_id={vod_id}")
     
-    user_collection = db.query(models.UserCollection).filter(
-        models.UserCollection.user_id == current_user.id
+    exists = db.query(models.UserCollectionItem.id).filter(
+        models.UserCollectionItem.user_id == current_user.id,
+        models.UserCollectionItem.movdetail_id == vod_id
     ).first()
+    if exists:
+        return {
+            'code': 200,
+            'message': '视频已收藏'
+        }
     
-    vod_id_str = str(vod_id)
-    
-    # 如果有收藏信息则更新，没有则添加
-    if user_collection:
-        # 检查是否已经收藏
-        current_ids = user_collection.movdetail_id_list.strip(';')
-        ids_list = current_ids.split(';') if current_ids else []
-        
-        if vod_id_str not in ids_list:
-            ids_list.append(vod_id_str)
-            user_collection.movdetail_id_list = ';'.join(ids_list) + ';'
-            try:
-                db.commit()
-                print(f"更新收藏成功: {user_collection.movdetail_id_list}")
-            except Exception as e:
-                db.rollback()
-                print(f"更新收藏失败: {e}")
-                raise HTTPException(
-                    status_code=500,
-                    detail="收藏失败"
-                )
-        else:
-            return {
-                'code': 200,
-                'message': '视频已收藏'
-            }
-    else:
-        try:
-            user_collection = models.UserCollection(
-                user_id=current_user.id, 
-                movdetail_id_list=vod_id_str + ';'
-            )
-            db.add(user_collection)
-            db.commit()
-            print(f"新增收藏成功: {user_collection.movdetail_id_list}")
-        except Exception as e:
-            db.rollback()
-            print(f"新增收藏失败: {e}")
-            raise HTTPException(
-                status_code=500,
-                detail="收藏失败"
-            )
+    if not db.query(models.MovDetail.id).filter(models.MovDetail.id == vod_id).first():
+        raise HTTPException(
+            status_code=404,
+            detail="视频不存在"
+        )
+    
+    try:
+        db.add(models.UserCollectionItem(user_id=current_user.id, movdetail_id=vod_id))
+        db.commit()
+        favorite_cache.added(current_user.id, vod_id)
+    except IntegrityError:
+        # 并发重复收藏, 唯一索引兜底
+        db.rollback()
+        return {
+            'code': 200,
+            'message': '视频已收藏'
+        }
+    except Exception as e:
+        db.rollback()
+        print(f"新增收藏失败: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="收藏失败"
+        )
     
     return {
         'code': 200,
@@ -204,34 +211,27 @@ async def remove_collect_video(
     删除收藏视频 - 对应原Flask的 remove_collect_video
     """
     vod_id = collection_data.vod_id
-    user_collection = db.query(models.UserCollection).filter(
-        models.UserCollection.user_id == current_user.id
-    ).first()
+    try:
+        deleted = db.query(models.UserCollectionItem).filter(
+            models.UserCollectionItem.user_id == current_user.id,
+            models.UserCollectionItem.movdetail_id == vod_id
+        ).delete(synchronize_session=False)
+        db.commit()
+        favorite_cache.removed(current_user.id, vod_id)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=500,
+            detail=f"删除收藏失败: {str(e)}"
+        )
     
-    if user_collection:
-        try:
-            vod_id_str = str(vod_id) + ';'
-            user_collection.movdetail_id_list = user_collection.movdetail_id_list.replace(vod_id_str, '')
-            db.commit()
-            
-            # 获取更新后的收藏列表
-            store_vod_list = []
-            if user_collection.movdetail_id_list:
-                store_vod_list = list(set(user_collection.movdetail_id_list.strip(';').split(';')))
-            
-            return {
-                'code': 200,
-                'message': '视频删除收藏成功',
-                'data': store_vod_list
-            }
-        except Exception as e:
-            db.rollback()
-            raise HTTPException(
-                status_code=500,
-                detail=f"删除收藏失败: {str(e)}"
-            )
-    else:
+    if not deleted:
         raise HTTPException(
             status_code=400,
             detail="没有要删除收藏的视频信息"
-        )
\ No newline at end of file
+        )
+    
+    return {
+        'code': 200,
+        'message': '视频删除收藏成功'
+    }
@@ -0,0 +1,330 @@
+import asyncio
+import datetime
+import logging
+import os
+import random
+import time
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Set
+
+import httpx
+import ijson
+from starlette.concurrency import run_in_threadpool
+
+from app.database import SessionLocal
+from app import models
+from app.task.catalog_store import store_mov_infos, store_mov_details
+from app.task.page_parser import PageParser
+
+logger = logging.getLogger(__name__)
+
+# 片库并发爬虫
+# 多个抓取协程通过同一个带连接池的客户端并发请求分页接口 (全局令牌桶限速, 失败指数退避重试),
+# 响应体边下载边解析, 记录攒够一批即放入有界队列, 由单独的写入协程入库, 抓取、解析与写库流水线并行;
+# 每页数据与断点记录在同一事务内提交, 中断后重新运行会跳过已完成的页;
+# 任务无失败页完成后清除本次覆盖范围内的断点, 超过 CRAWL_CHECKPOINT_TTL 的断点视为过期, 不再跳过
+
+SAKURA_API = 'https://m3u8.apiyhzy.com/api.php/provide/vod/'
+UPSTREAM_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+}
+
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "8"))
+# 每秒最多发出的请求数, <= 0 表示不限速
+CRAWL_RATE = float(os.getenv("CRAWL_RATE", "10"))
+CRAWL_RETRIES = int(os.getenv("CRAWL_RETRIES", "4"))
+CRAWL_TIMEOUT = float(os.getenv("CRAWL_TIMEOUT", "20"))
+# 每页条数, 0 表示使用上游默认值; 页越大请求次数越少, 流式解析下内存占用不随页大小增长
+CRAWL_PAGE_SIZE = int(os.getenv("CRAWL_PAGE_SIZE", "0"))
+# 每次写库的记录数
+CRAWL_WRITE_BATCH = int(os.getenv("CRAWL_WRITE_BATCH", "200"))
+# 等待写库的批次上限, 写库跟不上时抓取协程在此等待
+CRAWL_WRITE_QUEUE = int(os.getenv("CRAWL_WRITE_QUEUE", "16"))
+# 断点有效期 (秒), 只用于续爬最近一次中断的任务, 更早的断点在下次运行时清除
+CRAWL_CHECKPOINT_TTL = float(os.getenv("CRAWL_CHECKPOINT_TTL", str(24 * 3600)))
+MAX_BACKOFF = 30
+
+# 任务名 -> (接口 ac 参数, 入库函数)
+JOBS = {
+    'mov_info': ('list', store_mov_infos),
+    'mov_detail': ('detail', store_mov_details),
+}
+
+
+class CrawlError(Exception):
+    """分页抓取失败"""
+
+
+class RateLimiter:
+    """令牌桶限速, 所有抓取协程共享"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def page_count(data: dict) -> int:
+    total = int(data['total'])
+    limit_per_page = int(data['limit'])
+    return (total // limit_per_page) + 1 if total % limit_per_page else total // limit_per_page
+
+
+def _load_checkpoints(job: str) -> Set[int]:
+    db = SessionLocal()
+    try:
+        return {
+            page for (page,) in db.query(models.CrawlCheckpoint.page).filter(
+                models.CrawlCheckpoint.job == job
+            ).all()
+        }
+    finally:
+        db.close()
+
+
+def _clear_checkpoints(job: str, before: Optional[datetime.datetime] = None,
+                       max_page: Optional[int] = None) -> None:
+    """清除断点; before: 只清除早于该时间的, max_page: 只清除前 N 页的"""
+    db = SessionLocal()
+    try:
+        query = db.query(models.CrawlCheckpoint).filter(models.CrawlCheckpoint.job == job)
+        if before is not None:
+            query = query.filter(models.CrawlCheckpoint.finished_at < before)
+        if max_page is not None:
+            query = query.filter(models.CrawlCheckpoint.page <= max_page)
+        query.delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+class CatalogCrawler:
+    def __init__(self, concurrency: int = CRAWL_CONCURRENCY, rate: float = CRAWL_RATE,
+                 retries: int = CRAWL_RETRIES, timeout: float = CRAWL_TIMEOUT, api: str = SAKURA_API,
+                 page_size: int = CRAWL_PAGE_SIZE, write_batch: int = CRAWL_WRITE_BATCH):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.retries = retries
+        self.timeout = timeout
+        self.api = api
+        self.page_size = page_size
+        self.write_batch = write_batch
+        self._limiter: Optional[RateLimiter] = None
+        self.failed_pages: List[int] = []
+        self.counters = {
+            'pages_fetched': 0,
+            'pages_written': 0,
+            'pages_skipped': 0,
+            'pages_failed': 0,
+            'items': 0,
+            'inserted': 0,
+            'updated': 0,
+            'unchanged': 0,
+            'skipped': 0,
+            'retries': 0,
+        }
+
+    # ---------- 抓取 ----------
+
+    async def stream_page(self, client: httpx.AsyncClient, ac: str, page: int,
+                          on_records: Callable[[List[dict]], Awaitable[None]],
+                          on_attempt: Optional[Callable[[], None]] = None) -> dict:
+        """
+        流式请求一页数据, 每解析出一批记录就交给 on_records, 返回顶层字段 (total / limit 等)
+        网络错误 / 429 / 5xx / 响应不完整时退避重试, 每次请求前调用 on_attempt 供调用方丢弃上次未完成的数据;
+        重试前已交出的记录会再次交出, 入库为幂等写入
+        """
+        params = {'ac': ac, 'pg': page}
+        if self.page_size:
+            params['pagesize'] = self.page_size
+        for attempt in range(self.retries + 1):
+            await self._limiter.acquire()
+            if on_attempt is not None:
+                on_attempt()
+            parser = PageParser()
+            try:
+                async with client.stream('GET', self.api, params=params) as response:
+                    if response.status_code == 200:
+                        async for chunk in response.aiter_bytes():
+                            records = parser.feed(chunk)
+                            if records:
+                                await on_records(records)
+                        records = parser.close()
+                        if records:
+                            await on_records(records)
+                        return parser.meta
+                    if response.status_code != 429 and response.status_code < 500:
+                        raise CrawlError(f"第 {page} 页请求失败, code: {response.status_code}")
+                    error = f"code: {response.status_code}"
+            except (httpx.TransportError, ijson.JSONError) as e:
+                error = repr(e)
+            if attempt == self.retries:
+                break
+            self.counters['retries'] += 1
+            delay = min(MAX_BACKOFF, 2 ** attempt) * (0.5 + random.random() / 2)
+            logger.warning(f"第 {page} 页抓取失败 ({error}), {delay:.1f}s 后重试")
+            await asyncio.sleep(delay)
+        raise CrawlError(f"第 {page} 页重试 {self.retries} 次后仍失败 ({error})")
+
+    async def _crawl_page(self, client: httpx.AsyncClient, ac: str, page: int,
+                          write_queue: asyncio.Queue, store: bool = True) -> dict:
+        # 记录攒够一批就送去写库, 内存中最多保留 CRAWL_WRITE_BATCH 条加上写库队列中的批次
+        buffer: List[dict] = []
+        received = 0
+
+        def reset() -> None:
+            # 重试时整页重新解析, 上次请求未送出的记录和计数作废
+            nonlocal received
+            buffer.clear()
+            received = 0
+
+        async def collect(records: List[dict]) -> None:
+            nonlocal received
+            if not store:
+                return
+            received += len(records)
+            buffer.extend(records)
+            while len(buffer) >= self.write_batch:
+                await write_queue.put((page, buffer[:self.write_batch], None))
+                del buffer[:self.write_batch]
+
+        meta = await self.stream_page(client, ac, page, collect, reset)
+        self.counters['pages_fetched'] += 1
+        if store:
+            # 最后一批与本页断点 (附本页条数) 一起提交
+            await write_queue.put((page, buffer, received))
+        return meta
+
+    async def _fetch_worker(self, client: httpx.AsyncClient, ac: str, pages: Iterator[int],
+                            write_queue: asyncio.Queue) -> None:
+        # 所有抓取协程共用一个页码迭代器, 取到哪页抓哪页
+        for page in pages:
+            try:
+                await self._crawl_page(client, ac, page, write_queue)
+            except CrawlError as e:
+                # 失败的页不记录断点, 下次运行时重新抓取
+                self.counters['pages_failed'] += 1
+                self.failed_pages.append(page)
+                logger.error(str(e))
+
+    # ---------- 写库 ----------
+
+    @staticmethod
+    def _write_batch(db, job: str, page: int, records: List[dict], page_items: Optional[int]) -> Dict[str, int]:
+        # page_items 不为 None 表示本页最后一批
+        try:
+            result = JOBS[job][1](db, records)
+            if page_items is not None:
+                db.add(models.CrawlCheckpoint(job=job, page=page, items=page_items))
+            db.commit()
+            return result
+        except Exception:
+            db.rollback()
+            raise
+
+    async def _write_worker(self, job: str, write_queue: asyncio.Queue) -> None:
+        # 写库在线程池中串行执行, 整个任务复用同一个会话
+        db = SessionLocal()
+        try:
+            while True:
+                item = await write_queue.get()
+                if item is None:
+                    return
+                page, records, page_items = item
+                result = await run_in_threadpool(self._write_batch, db, job, page, records, page_items)
+                for key, value in result.items():
+                    self.counters[key] += value
+                if page_items is not None:
+                    # 按页计数, 重试时重复写入的批次不重复计入
+                    self.counters['items'] += page_items
+                    self.counters['pages_written'] += 1
+                    logger.info(f'{job} page {page} catched ({page_items} items)')
+        finally:
+            await run_in_threadpool(db.close)
+
+    # ---------- 任务 ----------
+
+    async def run(self, job: str, max_pages: Optional[int] = None, resume: bool = True) -> dict:
+        """
+        抓取整个分页接口并入库
+        job: mov_info / mov_detail
+        max_pages: 只抓取前 N 页 (默认全部)
+        resume: 跳过上次中断前 (CRAWL_CHECKPOINT_TTL 内) 已完成的页; False 时清除断点从头抓取
+        """
+        ac = JOBS[job][0]
+        started = time.perf_counter()
+        self._limiter = RateLimiter(self.rate)
+
+        # 过期断点直接删除, 否则本次重新抓取该页时写入断点会与唯一索引冲突
+        expired_before = datetime.datetime.utcnow() - datetime.timedelta(seconds=CRAWL_CHECKPOINT_TTL)
+        await run_in_threadpool(_clear_checkpoints, job, expired_before if resume else None)
+        done_pages = await run_in_threadpool(_load_checkpoints, job)
+
+        async with httpx.AsyncClient(
+            headers=UPSTREAM_HEADERS,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+        ) as client:
+            write_queue: asyncio.Queue = asyncio.Queue(maxsize=CRAWL_WRITE_QUEUE)
+            writer = asyncio.ensure_future(self._write_worker(job, write_queue))
+            fetching = None
+            try:
+                # 第 1 页用于获取总页数, 未完成时数据同样入库
+                meta = await self._crawl_page(client, ac, 1, write_queue, store=1 not in done_pages)
+                total_page = page_count(meta)
+                if max_pages is not None:
+                    total_page = min(total_page, max_pages)
+
+                pending = [page for page in range(2, total_page + 1) if page not in done_pages]
+                self.counters['pages_skipped'] = len(done_pages & set(range(1, total_page + 1)))
+                logger.info(f"{job}: 共 {total_page} 页, 已完成 {self.counters['pages_skipped']} 页, 待抓取 {len(pending)} 页")
+
+                pages = iter(pending)
+                fetching = asyncio.gather(*[
+                    self._fetch_worker(client, ac, pages, write_queue)
+                    for _ in range(self.concurrency)
+                ])
+                # 写库出错时立即停止抓取
+                await asyncio.wait([fetching, writer], return_when=asyncio.FIRST_COMPLETED)
+                if writer.done():
+                    writer.result()
+                await fetching
+                await write_queue.put(None)
+                await writer
+            finally:
+                if fetching is not None:
+                    fetching.cancel()
+                writer.cancel()
+
+        if not self.failed_pages:
+            # 本次范围内的页全部完成, 清除这些页的断点, 下次运行从头抓取最新数据;
+            # 只抓前 N 页时保留更靠后的页的断点, 不影响中断的全量任务续爬
+            await run_in_threadpool(_clear_checkpoints, job, None,
+                                     total_page if max_pages is not None else None)
+
+        return {
+            **self.counters,
+            'job': job,
+            'total_pages': total_page,
+            'failed_pages': sorted(self.failed_pages),
+            'seconds': round(time.perf_counter() - started, 1),
+        }
+
+
+def crawl(job: str, max_pages: Optional[int] = None, resume: bool = True, **options) -> dict:
+    """同步入口, 供脚本调用"""
+    return asyncio.run(CatalogCrawler(**options).run(job, max_pages=max_pages, resume=resume))
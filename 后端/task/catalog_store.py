@@ -0,0 +1,118 @@
+import hashlib
+import json
+from typing import Dict, List
+
+from sqlalchemy import Table
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.orm import Session
+
+from app import models, search, playurl
+
+# 片库入库
+# 爬虫抓到的一页数据按集合写入, 不论页大小都只需少量语句:
+# 先用一次 IN 查询找出已有的行, 已有的行以主键 INSERT ... ON DUPLICATE KEY UPDATE 批量更新,
+# 新行批量插入. 均不提交事务, 由调用方按页提交; 返回本页插入 / 更新 / 未变化 / 跳过的条数.
+# movdetail 按上游原始记录计算内容摘要存入 content_hash, 摘要未变的影片整行跳过,
+# 不写库、也不重建索引
+
+MOVINFO_COLUMNS = [column.name for column in models.MovInfo.__table__.columns]
+# id 为本地自增主键, 上游数据不携带
+MOVDETAIL_COLUMNS = [column.name for column in models.MovDetail.__table__.columns if column.name != 'id']
+# 参与摘要计算的上游字段 (不含入库时派生的字段)
+DERIVED_COLUMNS = ('vod_play_list', 'vod_content_clean', 'content_hash')
+SOURCE_COLUMNS = [name for name in MOVDETAIL_COLUMNS if name not in DERIVED_COLUMNS]
+
+
+def empty_result() -> Dict[str, int]:
+    return {'inserted': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0}
+
+
+def content_digest(record: dict) -> str:
+    """上游记录的内容摘要, 字段顺序无关"""
+    payload = json.dumps(
+        {name: record.get(name) for name in SOURCE_COLUMNS},
+        ensure_ascii=False, sort_keys=True, default=str
+    )
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _upsert(db: Session, table: Table, key: str, rows: List[dict]) -> None:
+    """按主键批量写入, 主键已存在时更新其余字段 (executemany 合并为一条多行语句)"""
+    statement = insert(table)
+    statement = statement.on_duplicate_key_update({
+        column.name: statement.inserted[column.name] for column in table.columns if column.name != key
+    })
+    db.execute(statement, rows)
+
+
+def _dedupe(records: List[dict], columns: List[str]) -> Dict[int, dict]:
+    # 同一页内重复的 vod_id 以后出现的为准
+    return {int(record['vod_id']): {name: record.get(name) for name in columns} for record in records}
+
+
+def store_mov_infos(db: Session, records: List[dict]) -> Dict[str, int]:
+    """写入一页 movinfo 并刷新对应影片的搜索索引 (vod_en 来自 movinfo)"""
+    result = empty_result()
+    if not records:
+        return result
+    rows = _dedupe(records, MOVINFO_COLUMNS)
+    existing = {
+        vod_id for (vod_id,) in db.query(models.MovInfo.vod_id).filter(
+            models.MovInfo.vod_id.in_(list(rows))
+        ).all()
+    }
+    _upsert(db, models.MovInfo.__table__, 'vod_id', list(rows.values()))
+    search.index_vod_ids(db, list(rows))
+    result['updated'] = len(existing)
+    result['inserted'] = len(rows) - len(existing)
+    result['skipped'] = len(records) - len(rows)
+    return result
+
+
+def store_mov_details(db: Session, records: List[dict]) -> Dict[str, int]:
+    """
+    写入一页 movdetail: 新的 vod_id 插入, 内容摘要变化的按主键更新, 其余跳过;
+    只为有变化的影片刷新搜索索引
+    """
+    result = empty_result()
+    if not records:
+        return result
+    # 同一页内重复的 vod_id 以后出现的为准
+    latest = {int(record['vod_id']): record for record in records}
+    existing = {
+        vod_id: (movdetail_id, content_hash)
+        for vod_id, movdetail_id, content_hash in db.query(
+            models.MovDetail.vod_id, models.MovDetail.id, models.MovDetail.content_hash
+        ).filter(
+            models.MovDetail.vod_id.in_(list(latest))
+        ).all()
+    }
+
+    updates = []
+    inserts = []
+    for vod_id, record in latest.items():
+        digest = content_digest(record)
+        current = existing.get(vod_id)
+        if current is not None and current[1] == digest:
+            result['unchanged'] += 1
+            continue
+        # 只对需要写入的记录做剧集拆分等预处理
+        playurl.prepare_movdetail(record)
+        record['content_hash'] = digest
+        row = {name: record.get(name) for name in MOVDETAIL_COLUMNS}
+        if current is not None:
+            updates.append({**row, 'id': current[0]})
+        else:
+            inserts.append(row)
+
+    if updates:
+        _upsert(db, models.MovDetail.__table__, 'id', updates)
+    if inserts:
+        db.execute(models.MovDetail.__table__.insert(), inserts)
+    changed_vod_ids = [row['vod_id'] for row in updates + inserts]
+    if changed_vod_ids:
+        search.index_vod_ids(db, changed_vod_ids)
+    result['updated'] = len(updates)
+    result['inserted'] = len(inserts)
+    result['skipped'] = len(records) - len(latest)
+    return result
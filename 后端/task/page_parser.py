@@ -0,0 +1,49 @@
+from typing import Any, Dict, List
+
+import ijson
+
+# 分页接口响应的流式解析
+# 响应体按块送入增量解析器, list 数组中的记录每解析完一条就交给调用方,
+# 不再先读出整段文本、再构建整棵字典树; 顶层的 total / limit 等标量字段同时收集到 meta
+
+RECORD_PREFIX = 'list.item'
+SCALAR_EVENTS = ('string', 'number', 'boolean', 'null')
+
+
+class PageParser:
+    def __init__(self):
+        self._events = ijson.sendable_list()
+        self._parser = ijson.parse_coro(self._events, use_float=True)
+        self._builder = None
+        self.meta: Dict[str, Any] = {}
+        self.records = 0
+
+    def feed(self, chunk: bytes) -> List[dict]:
+        """送入一块响应体, 返回其中已解析完整的记录"""
+        if chunk:
+            self._parser.send(chunk)
+        return self._drain()
+
+    def close(self) -> List[dict]:
+        """响应体结束, 返回剩余记录; 响应不完整时抛出 ijson.IncompleteJSONError"""
+        self._parser.close()
+        return self._drain()
+
+    def _drain(self) -> List[dict]:
+        records = []
+        for prefix, event, value in self._events:
+            if self._builder is None:
+                if prefix == RECORD_PREFIX and event == 'start_map':
+                    self._builder = ijson.ObjectBuilder()
+                elif event in SCALAR_EVENTS and prefix and '.' not in prefix:
+                    self.meta[prefix] = value
+                    continue
+                else:
+                    continue
+            self._builder.event(event, value)
+            if prefix == RECORD_PREFIX and event == 'end_map':
+                records.append(self._builder.value)
+                self._builder = None
+        del self._events[:]
+        self.records += len(records)
+        return records
@@ -5,11 +5,44 @@ from sqlalchemy import func
 from sqlalchemy.orm import Session
 from app.database import SessionLocal
 from app import models
+from app.task.catalog_store import store_mov_infos, store_mov_details
+from app.task.catalog_crawler import crawl, page_count, CrawlError, CRAWL_WRITE_BATCH
+from app.task.page_parser import PageParser
+from typing import Iterator, List, Tuple
 import logging
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# 单次请求超时 (秒)
+REQUEST_TIMEOUT = 20
+# 流式读取响应体的块大小
+CHUNK_SIZE = 64 * 1024
+
+
+def fetch_page(url: str, batch_size: int = CRAWL_WRITE_BATCH) -> Iterator[Tuple[dict, List[dict]]]:
+    '''
+    流式请求一页接口数据, 边下载边解析, 每攒够 batch_size 条记录产出一次 (顶层字段, 本批记录),
+    内存中最多保留一批; 响应结束后总会产出最后一批 (可能为空), 此时顶层字段已完整.
+    请求失败时抛出 CrawlError; 调用方提前停止迭代时关闭连接
+    '''
+    with requests.get(url, timeout=REQUEST_TIMEOUT, stream=True) as response:
+        if response.status_code != 200:
+            raise CrawlError(f"抓取数据失败, code: {response.status_code}")
+        parser = PageParser()
+        buffer = []
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            buffer.extend(parser.feed(chunk))
+            while len(buffer) >= batch_size:
+                yield parser.meta, buffer[:batch_size]
+                del buffer[:batch_size]
+        buffer.extend(parser.close())
+        while len(buffer) > batch_size:
+            yield parser.meta, buffer[:batch_size]
+            del buffer[:batch_size]
+        yield parser.meta, buffer
+
+
 class SakuraDataSchedule:
     def __init__(self):
         self.sakura_list = 'https://m3u8.apiyhzy.com/api.php/provide/vod/?ac=list&pg={page}'
@@ -17,6 +50,8 @@ class SakuraDataSchedule:
         self.total_page = None
         self.avalon_latest_time = None
         self.stop_craw = False  # 当此值为True 不继续抓取数据
+        # 本次同步累计的插入 / 更新 / 内容未变 / 跳过条数
+        self.metrics = {'pages': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0}
 
     def get_avalon_latest_time(self, db: Session) -> datetime.datetime:
         '''
@@ -29,69 +64,80 @@ class SakuraDataSchedule:
         avalon_latest_time = datetime.datetime.strptime(avalon_latest_time_str, '%Y-%m-%d')
         return avalon_latest_time
 
-    def insert_or_update_movdetail(self, db: Session, mov_list: list) -> None:
+    def insert_or_update_movdetail(self, db: Session, mov_list: list) -> dict:
         '''
-        将 movdetail 数据 插入或更新到数据库
+        将一批 movdetail 数据 插入或更新到数据库
+        整批按集合写入 (一次 IN 查询 + 批量更新 + 批量插入), 一批一个事务
         '''
-        need_insert_mov_list = []
+        fresh_mov_list = []
+        stale_count = 0
         for mov_detail in mov_list:
             vod_time_str = mov_detail.get('vod_time')
             vod_time = datetime.datetime.strptime(vod_time_str, '%Y-%m-%d %H:%M:%S')
             if vod_time > self.avalon_latest_time:
-                # 进行更新或插入数据操作
-                self.stop_craw = False
-                vod_id = mov_detail['vod_id']
-                avalon_mov_detail = db.query(models.MovDetail).filter(models.MovDetail.vod_id == vod_id).first()
-                if avalon_mov_detail:
-                    # 数据库已有此数据 执行更新操作
-                    for k, v in mov_detail.items():
-                        setattr(avalon_mov_detail, k, v)
-                    db.commit()
-                else:
-                    # 数据库没有此数据 执行插入操作
-                    need_insert_mov_list.append(mov_detail)
+                fresh_mov_list.append(mov_detail)
             else:
-                self.stop_craw = True
+                stale_count += 1
+        # 上游按更新时间倒序, 出现旧数据说明本页剩余部分和后面的页都已同步
+        if stale_count > 0:
+            self.stop_craw = True
 
-        if need_insert_mov_list:
-            # 如果有需要插入的新数据
-            db.bulk_insert_mappings(models.MovDetail, need_insert_mov_list)
+        try:
+            result = store_mov_details(db, fresh_mov_list)
             db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        result['skipped'] += stale_count
+
+        for key, value in result.items():
+            self.metrics[key] += value
+        logger.info(f"本批插入 {result['inserted']} 条, 更新 {result['updated']} 条, "
+                    f"内容未变 {result['unchanged']} 条, 跳过 {result['skipped']} 条")
+        return result
+
+    def sync_page(self, db: Session, page: int) -> dict:
+        '''
+        流式同步一页 movdetail, 逐批入库, 遇到已同步的数据即停止读取; 返回顶层字段
+        '''
+        url = self.sakura_detail.format(page=page)
+        logger.info(f'Updating: {url}')
+        meta = {}
+        for meta, mov_detail_list in fetch_page(url):
+            self.insert_or_update_movdetail(db, mov_detail_list)
+            if self.stop_craw:
+                break
+        self.metrics['pages'] += 1
+        return meta
 
-    def get_sakura_data(self) -> None:
+    def get_sakura_data(self) -> dict:
         '''
         获取樱花数据 对已有数据进行更新操作 其他执行插入操作
+        返回本次同步的累计统计
         '''
         db = SessionLocal()
         try:
             self.avalon_latest_time = self.get_avalon_latest_time(db)
 
-            url = self.sakura_detail.format(page=1)
-            logger.info(f'Updating: {url}')
-            response = requests.get(url)
-            if response.status_code == 200:
-                data = json.loads(response.text)
-                total = int(data['total'])
-                limit_per_page = int(data['limit'])
-                self.total_page = (total // limit_per_page) + 1 if total % limit_per_page else total // limit_per_page
-                mov_detail_list = data['list']
-                self.insert_or_update_movdetail(db, mov_detail_list)
-            else:
-                logger.debug(f"抓取数据失败, code: {response.status_code}")
+            try:
+                meta = self.sync_page(db, 1)
+            except CrawlError as e:
+                raise Exception(f"同步失败: 无法获取第 1 页数据 ({e})")
+            # 第 1 页就读到已同步的数据时提前停止, 顶层字段可能不完整, 也不再需要总页数
+            self.total_page = 1 if self.stop_craw else page_count(meta)
+            if self.stop_craw:
+                logger.info("数据已更新完毕: 停止抓取")
 
-            for i in range(2, self.total_page):
-                url = self.sakura_detail.format(page=i)
+            for i in range(2, self.total_page + 1):
                 if self.stop_craw:
                     logger.info("数据已更新完毕: 停止抓取")
                     break
-                logger.info(f'Updating: {url}')
-                response = requests.get(url)
-                if response.status_code == 200:
-                    data = json.loads(response.text)
-                    mov_detail_list = data['list']
-                    self.insert_or_update_movdetail(db, mov_detail_list)
-                else:
-                    logger.debug(f"抓取数据失败, code: {response.status_code}")
+                try:
+                    self.sync_page(db, i)
+                except CrawlError as e:
+                    logger.debug(f"第 {i} 页: {e}")
+            logger.info(f"增量同步完成: {self.metrics}")
+            return self.metrics
         finally:
             db.close()
 
@@ -105,15 +151,13 @@ class SakuraData:
 
     def __init_sakura__(self):
         url = self.sakura_list.format(page=1)
-        response = requests.get(url)
+        response = requests.get(url, timeout=REQUEST_TIMEOUT)
         if response.status_code == 200:
             data = json.loads(response.text)
             if self.mov_type is None:
                 self.mov_type = data['class']
             if self.total_page is None:
-                total = int(data['total'])
-                limit_per_page = int(data['limit'])
-                self.total_page = (total // limit_per_page) + 1 if total % limit_per_page else total // limit_per_page
+                self.total_page = page_count(data)
         else:
             raise Exception(f"初始化失败: 无法获取数据")
 
@@ -128,16 +172,12 @@ class SakuraData:
         '''
         db = SessionLocal()
         try:
-            url = self.sakura_list.format(page=page)
-            response = requests.get(url)
-            if response.status_code == 200:
-                data = json.loads(response.text)
-                mov_info_list = data['list']
-                db.bulk_insert_mappings(models.MovInfo, mov_info_list)
+            for _, mov_list in fetch_page(self.sakura_list.format(page=page)):
+                store_mov_infos(db, mov_list)
                 db.commit()
-                logger.info(f'mov_list page {page} catched')
-            else:
-                logger.debug(f"抓取数据失败, code: {response.status_code}")
+            logger.info(f'mov_list page {page} catched')
+        except CrawlError as e:
+            logger.debug(str(e))
         finally:
             db.close()
 
@@ -147,23 +187,23 @@ class SakuraData:
         '''
         db = SessionLocal()
         try:
-            url = self.sakura_detail.format(page=page)
-            response = requests.get(url)
-            if response.status_code == 200:
-                data = json.loads(response.text)
-                mov_detail_list = data['list']
-                db.bulk_insert_mappings(models.MovDetail, mov_detail_list)
+            for _, mov_detail_list in fetch_page(self.sakura_detail.format(page=page)):
+                store_mov_details(db, mov_detail_list)
                 db.commit()
-                logger.info(f'mov_detail page {page} catched')
-            else:
-                logger.debug(f"抓取数据失败, code: {response.status_code}")
+            logger.info(f'mov_detail page {page} catched')
+        except CrawlError as e:
+            logger.debug(str(e))
         finally:
             db.close()
 
-    def crawl_mov_info_all(self):
-        for page in range(self.total_page):
-            self.get_mov_info(page)
+    def crawl_mov_info_all(self, resume=True):
+        '''
+        并发抓取全部电影基本信息, 中断后再次调用从断点继续
+        '''
+        return crawl('mov_info', resume=resume)
 
-    def crawl_mov_detail_all(self):
-        for page in range(self.total_page):
-            self.get_mov_detail(page)
\ No newline at end of file
+    def crawl_mov_detail_all(self, resume=True):
+        '''
+        并发抓取全部电影详细信息, 中断后再次调用从断点继续
+        '''
+        return crawl('mov_detail', resume=resume)
\ No newline at end of file
@@ -0,0 +1,210 @@
+import asyncio
+import datetime
+import logging
+import os
+import random
+import socket
+import time
+from typing import Optional
+
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+from app.database import engine, SessionLocal
+from app import models
+from app.task.sakura_crawler import SakuraDataSchedule
+
+logger = logging.getLogger(__name__)
+
+# 片库增量同步调度
+# 按固定间隔 (带随机抖动) 运行 SakuraDataSchedule.get_sakura_data, 只抓取上次同步之后更新的影片;
+# 多个 worker / 进程同时调度时通过 MySQL GET_LOCK 保证同一时刻只有一个在运行,
+# 每次运行写入 sakura_sync_run 记录耗时与插入 / 更新 / 未变条数.
+# 在应用内启用需设置 CATALOG_SYNC_ENABLED=1, 也可以用 sync_daemon.py 单独运行
+
+SYNC_ENABLED = os.getenv("CATALOG_SYNC_ENABLED", "0") == "1"
+SYNC_INTERVAL = float(os.getenv("CATALOG_SYNC_INTERVAL", "3600"))
+# 间隔的随机浮动比例, 避免多个实例同时醒来
+SYNC_JITTER = float(os.getenv("CATALOG_SYNC_JITTER", "0.1"))
+# 启动后首次同步前的等待秒数
+SYNC_INITIAL_DELAY = float(os.getenv("CATALOG_SYNC_INITIAL_DELAY", "60"))
+LOCK_NAME = 'sakura_catalog_sync'
+RUNNER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class CatalogSyncScheduler:
+    def __init__(self, interval: float, jitter: float, initial_delay: float):
+        self.interval = interval
+        self.jitter = jitter
+        self.initial_delay = initial_delay
+        self._task: Optional[asyncio.Task] = None
+        # 手动触发的后台任务, 保留引用避免被回收, 也用于拒绝重复触发
+        self._manual_task: Optional[asyncio.Task] = None
+        self.running = False
+        self.last_run: Optional[dict] = None
+        self.counters = {
+            'runs': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'lock_busy': 0,
+            'rows_inserted': 0,
+            'rows_updated': 0,
+            'rows_unchanged': 0,
+            'duration_ms_total': 0,
+        }
+
+    def next_delay(self, base: float) -> float:
+        return max(1.0, base * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    # ---------- 单次同步 ----------
+
+    def _sync(self, trigger: str) -> dict:
+        db = SessionLocal()
+        try:
+            # 已持有锁, 之前残留的 running 记录都是中途退出的进程留下的
+            db.query(models.CatalogSyncRun).filter(
+                models.CatalogSyncRun.status == 'running'
+            ).update({'status': 'aborted'}, synchronize_session=False)
+            run = models.CatalogSyncRun(trigger=trigger, status='running', runner=RUNNER_ID)
+            db.add(run)
+            db.commit()
+
+            started = time.perf_counter()
+            schedule = SakuraDataSchedule()
+            try:
+                schedule.get_sakura_data()
+                run.status = 'success'
+            except Exception as e:
+                logger.exception("片库同步失败")
+                run.status = 'failed'
+                run.error = str(e)[:2000]
+            run.finished_at = datetime.datetime.utcnow()
+            run.duration_ms = int((time.perf_counter() - started) * 1000)
+            for key, value in schedule.metrics.items():
+                setattr(run, key, value)
+            db.commit()
+            return self._serialize(run)
+        finally:
+            db.close()
+
+    def run_once(self, trigger: str = 'schedule') -> Optional[dict]:
+        """
+        执行一次增量同步 (阻塞, 在线程中调用)
+        其他实例正在同步时直接返回 None
+        """
+        with engine.connect() as conn:
+            acquired = conn.execute(text("SELECT GET_LOCK(:name, 0)"), {'name': LOCK_NAME}).scalar()
+            if acquired != 1:
+                self.counters['lock_busy'] += 1
+                logger.info("其他实例正在同步片库, 跳过本次")
+                return None
+            self.running = True
+            try:
+                result = self._sync(trigger)
+            finally:
+                self.running = False
+                conn.execute(text("SELECT RELEASE_LOCK(:name)"), {'name': LOCK_NAME})
+
+        self.counters['runs'] += 1
+        self.counters['succeeded' if result['status'] == 'success' else 'failed'] += 1
+        self.counters['rows_inserted'] += result['inserted']
+        self.counters['rows_updated'] += result['updated']
+        self.counters['rows_unchanged'] += result['unchanged']
+        self.counters['duration_ms_total'] += result['duration_ms']
+        self.last_run = result
+        logger.info(f"片库同步结束: {result}")
+        return result
+
+    async def run_now(self, trigger: str = 'manual') -> Optional[dict]:
+        return await run_in_threadpool(self.run_once, trigger)
+
+    async def _run_logged(self, trigger: str) -> None:
+        try:
+            await self.run_now(trigger)
+        except Exception as e:
+            print(f"⚠️ 片库同步调度失败: {e}")
+
+    def lock_held(self) -> bool:
+        """同步锁是否被占用, 包括其他 worker 与 sync_daemon (阻塞, 在线程中调用)"""
+        with engine.connect() as conn:
+            free = conn.execute(text("SELECT IS_FREE_LOCK(:name)"), {'name': LOCK_NAME}).scalar()
+        return free != 1
+
+    def _manual_pending(self) -> bool:
+        return self._manual_task is not None and not self._manual_task.done()
+
+    async def is_busy(self) -> bool:
+        """本进程或任一实例正在同步"""
+        if self.running or self._manual_pending():
+            return True
+        return await run_in_threadpool(self.lock_held)
+
+    def trigger(self) -> bool:
+        """在后台立即执行一次 (管理员手动触发); 上次手动触发尚未结束时返回 False"""
+        if self._manual_pending():
+            return False
+        self._manual_task = asyncio.ensure_future(self._run_logged('manual'))
+        return True
+
+    # ---------- 定时调度 ----------
+
+    async def run_forever(self, trigger: str = 'schedule') -> None:
+        await asyncio.sleep(self.next_delay(self.initial_delay))
+        while True:
+            await self._run_logged(trigger)
+            await asyncio.sleep(self.next_delay(self.interval))
+
+    def start(self) -> None:
+        """启动后台调度任务, 在应用启动时调用 (未启用时不做任何事)"""
+        if SYNC_ENABLED and self._task is None:
+            self._task = asyncio.ensure_future(self.run_forever())
+
+    async def stop(self) -> None:
+        # 正在线程中执行的同步会继续跑完本页, 锁随连接关闭释放
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # ---------- 统计 ----------
+
+    @staticmethod
+    def _serialize(run: models.CatalogSyncRun) -> dict:
+        return {
+            'id': run.id,
+            'trigger': run.trigger,
+            'status': run.status,
+            'runner': run.runner,
+            'started_at': run.started_at.strftime("%Y-%m-%d %H:%M:%S") if run.started_at else None,
+            'finished_at': run.finished_at.strftime("%Y-%m-%d %H:%M:%S") if run.finished_at else None,
+            'duration_ms': run.duration_ms or 0,
+            'pages': run.pages or 0,
+            'inserted': run.inserted or 0,
+            'updated': run.updated or 0,
+            'unchanged': run.unchanged or 0,
+            'skipped': run.skipped or 0,
+            'error': run.error,
+        }
+
+    def recent_runs(self, db, limit: int = 20) -> list:
+        runs = db.query(models.CatalogSyncRun).order_by(
+            models.CatalogSyncRun.started_at.desc(), models.CatalogSyncRun.id.desc()
+        ).limit(limit).all()
+        return [self._serialize(run) for run in runs]
+
+    def stats(self) -> dict:
+        runs = self.counters['runs']
+        return {
+            **self.counters,
+            'enabled': SYNC_ENABLED,
+            'interval': self.interval,
+            'running': self.running,
+            'avg_duration_ms': round(self.counters['duration_ms_total'] / runs) if runs else 0,
+            'last_run': self.last_run,
+        }
+
+
+sync_scheduler = CatalogSyncScheduler(SYNC_INTERVAL, SYNC_JITTER, SYNC_INITIAL_DELAY)